@@ -0,0 +1,113 @@
+import unicodedata
+from datetime import date
+
+import numpy as np
+
+
+class Availability_index:
+    """Compiled availability for one scheduling run.
+
+    Students, teachers, dates and time slots are mapped to integer ids and
+    availability is held in boolean arrays:
+
+    - ``student_free[s, d, t]``     student ``s`` can attend date ``d`` / slot ``t``
+    - ``teacher_free[k, d, t, b]``  booth ``b`` of teacher ``k`` is open
+    - ``teacher_load[k, d, t]``     students already placed with teacher ``k``
+
+    The imported dicts are only read while compiling; ``assign`` flips bits
+    in the arrays. With ``exclusions`` (``Exclusions``), the closed slots are
+    masked out of both sides once everything is loaded, and again whenever
+    a row is reloaded.
+    """
+
+    def __init__(self, student_data, teacher_data, date_list, time_slots, exclusions=None):
+        self.dates = sorted(set(date_list))
+        self.times = list(time_slots)
+        self.date_ids = {day: i for i, day in enumerate(self.dates)}
+        self.day_numbers = [date.fromisoformat(day).toordinal() for day in self.dates]
+        self.time_ids = {unicodedata.normalize("NFKC", t): i for i, t in enumerate(self.times)}
+        self.student_names = list(student_data)
+        self.teacher_names = list(teacher_data)
+        self.student_ids = {name: i for i, name in enumerate(self.student_names)}
+        self.teacher_ids = {name: i for i, name in enumerate(self.teacher_names)}
+        self.booths = max(
+            (len(booths)
+             for info in teacher_data.values()
+             for slots in info.get("schedule", {}).values()
+             for booths in slots.values()),
+            default=0,
+        )
+
+        shape = (len(self.dates), len(self.times))
+        self.student_free = np.zeros((len(self.student_names),) + shape, dtype=bool)
+        self.teacher_free = np.zeros((len(self.teacher_names),) + shape + (self.booths,), dtype=bool)
+        self.teacher_load = np.zeros((len(self.teacher_names),) + shape, dtype=np.int16)
+        self.closed = self.teacher_closed = None  # exclusion masks, set once loading is done
+
+        for s, info in enumerate(student_data.values()):
+            self.load_student(s, info)
+        for k, info in enumerate(teacher_data.values()):
+            self.load_teacher(k, info)
+
+        if exclusions is not None:
+            self.closed = exclusions.mask(self.dates, self.times)  # (date, time)
+            self.teacher_closed = exclusions.mask(self.dates, self.times, self.teacher_names)  # (teacher, date, time)
+            self.student_free &= ~self.closed
+            self.teacher_free &= ~self.teacher_closed[..., None]
+
+    def load_student(self, s, info):
+        """(Re)load the availability row of student ``s`` from its imported record."""
+        self.student_free[s] = False
+        for d, t, free in self._iter_slots(info):
+            self.student_free[s, d, t] = bool(free)
+        if self.closed is not None:
+            self.student_free[s] &= ~self.closed
+
+    def load_teacher(self, k, info):
+        """(Re)load the booths of teacher ``k`` from its imported record."""
+        self.teacher_free[k] = False
+        for d, t, booths in self._iter_slots(info):
+            booths = booths[:self.booths]
+            self.teacher_free[k, d, t, :len(booths)] = booths
+        if self.teacher_closed is not None:
+            self.teacher_free[k] &= ~self.teacher_closed[k, :, :, None]
+
+    def _iter_slots(self, info):
+        for date_str, slots in info.get("schedule", {}).items():
+            d = self.date_ids.get(date_str)
+            if d is None:
+                continue
+            for time, value in slots.items():
+                t = self.time_ids.get(unicodedata.normalize("NFKC", time))
+                if t is not None:
+                    yield d, t, value
+
+    def free_mask(self, s, k):
+        """(date, time, booth) mask where student ``s`` and a booth of ``k`` are both free."""
+        return self.student_free[s, :, :, None] & self.teacher_free[k]
+
+    def open_mask(self, s, k, cap):
+        """``free_mask`` restricted to slots holding fewer than ``cap`` students."""
+        return self.free_mask(s, k) & (self.teacher_load[k] < cap)[:, :, None]
+
+    def is_available(self, s, k, d, t, b):
+        if b >= self.booths:
+            return False
+        return bool(self.student_free[s, d, t] and self.teacher_free[k, d, t, b])
+
+    def assign(self, s, k, d, t, b):
+        self.student_free[s, d, t] = False
+        self.teacher_free[k, d, t, b] = False
+        self.teacher_load[k, d, t] += 1
+
+    def release(self, s, k, d, t, b):
+        self.student_free[s, d, t] = True
+        self.teacher_free[k, d, t, b] = True
+        self.teacher_load[k, d, t] -= 1
+
+    def first_open_booth(self, s, k, d, t, cap):
+        """Lowest free booth of ``k`` at (d, t) for student ``s``, or -1."""
+        if not self.student_free[s, d, t] or self.teacher_load[k, d, t] >= cap:
+            return -1
+        booths = np.flatnonzero(self.teacher_free[k, d, t])
+        return int(booths[0]) if len(booths) else -1
@@ -0,0 +1,181 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+
+from openpyxl import load_workbook
+from openpyxl.styles import Border, Side
+
+from benchmarks.synthetic import write_inputs
+from instrumentation import Instrumentation
+from match_module import load_match
+from schedule_result import ENGINES, Schedule_result
+from student_data import load_students
+from teacher_schedule import load_teachers
+from template_engine import template_cache
+from xlsx_stream import Xlsx_stream
+
+DEFAULT_SIZES = (50, 500)
+WORK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".work")
+
+
+def inputs_for(students, seed, work_dir=WORK_DIR):
+    """Synthetic inputs for a size/seed pair, generated once and reused by later runs."""
+    directory = os.path.join(work_dir, f"students{students}_seed{seed}")
+    manifest = os.path.join(directory, "inputs.json")
+    if os.path.exists(manifest):
+        with open(manifest, "r", encoding="utf-8") as f:
+            return json.load(f)
+    paths = write_inputs(directory, students=students, seed=seed)
+    with open(manifest, "w", encoding="utf-8") as f:
+        json.dump(paths, f, ensure_ascii=False, indent=2)
+    return paths
+
+
+def _fingerprints(path):
+    with Xlsx_stream(path) as book:
+        return {name: book.sheet_fingerprint(name) for name in book.sheet_names}
+
+
+def check_fingerprints(paths, directory):
+    """Assert that editing the last cell of a sheet changes that sheet's fingerprint, and only that one.
+
+    Parse_cache keys are built from the fingerprints; a missed edit would
+    let the importers time stale cache hits. Both copies are saved through
+    openpyxl, so the edit (a toggled diagonal in the teacher workbook, a new
+    count in the match workbook) is the only difference between them.
+    """
+    for path in (paths["teacher"], paths["match"]):
+        book = load_workbook(path)
+        before, after = (os.path.join(directory, f"{tag}_{os.path.basename(path)}") for tag in ("before", "after"))
+        book.save(before)
+        edited = book.worksheets[-1]
+        cell = edited.cell(edited.max_row, edited.max_column)
+        if path == paths["teacher"]:
+            crossed = Border(diagonal=Side(style="thin"), diagonalDown=True)
+            cell.border = Border() if cell.border.diagonalDown else crossed
+        else:
+            cell.value = 99
+        book.save(after)
+        old, new = _fingerprints(before), _fingerprints(after)
+        changed = {name for name in old if old[name] != new[name]}
+        assert changed == {edited.title}, f"{os.path.basename(path)}: edited {edited.title!r}, keys changed {changed}"
+
+
+def run_once(paths, engine="greedy", jobs=1, streaming=False):
+    """Time every stage of one cold pipeline run in the current directory."""
+    template_cache.clear()  # every run loads and compiles its templates
+    instrumentation = Instrumentation()
+    with instrumentation.span("import_students"):
+        students = load_students(paths["students"], jobs=jobs)
+    with instrumentation.span("import_teachers"):
+        teachers, dates = load_teachers(paths["teacher"], jobs=jobs)
+    with instrumentation.span("import_match"):
+        match = load_match(paths["match"])
+
+    sr = Schedule_result(students, teachers, match, paths["students"], paths["teacher"], dates,
+                         engine=engine, jobs=jobs, streaming=streaming, instrumentation=instrumentation)
+    sr.normalize_student_names()
+    with instrumentation.span("generate_schedule"):
+        sr.generate_schedule()
+    sr.generate_outputs(1)  # spans every writer
+    stages = {span["name"]: span["wall"] for span in instrumentation.spans}
+    counts = {"students": len(students), "teachers": len(teachers),
+              "entries": len(sr.schedule_data), "unplaced": sum(instrumentation.unplaced_by_teacher.values()),
+              "probed": instrumentation.probed, "rejections": dict(instrumentation.rejections)}
+    return stages, counts
+
+
+def run_size(students, seed=0, repeat=1, work_dir=WORK_DIR, **options):
+    """Best-of-``repeat`` stage times for one size."""
+    paths = inputs_for(students, seed, work_dir)
+    run_dir = os.path.join(os.path.dirname(paths["teacher"]), "run")
+    os.makedirs(run_dir, exist_ok=True)
+    cwd = os.getcwd()
+    os.chdir(run_dir)  # the generators write output/ into the working directory
+    try:
+        best, counts = {}, {}
+        for _ in range(repeat):
+            stages, counts = run_once(paths, **options)
+            for stage, seconds in stages.items():
+                best[stage] = min(seconds, best.get(stage, seconds))
+    finally:
+        os.chdir(cwd)
+    return {"size": students, "seed": seed, "counts": counts, "stages": best,
+            "total": round(sum(best.values()), 4)}
+
+
+def compare(results, baseline, threshold, min_seconds=0.05):
+    """Stages slower than ``baseline`` by more than ``threshold`` (a fraction) and ``min_seconds``."""
+    before = {(run["size"], stage): seconds for run in baseline["runs"] for stage, seconds in run["stages"].items()}
+    regressions = []
+    for run in results["runs"]:
+        for stage, seconds in run["stages"].items():
+            old = before.get((run["size"], stage))
+            if old is not None and seconds > old * (1 + threshold) and seconds - old > min_seconds:
+                regressions.append({"size": run["size"], "stage": stage, "baseline": old, "seconds": seconds,
+                                    "ratio": round(seconds / old, 2) if old else None})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.run",
+        description="Time each pipeline stage on synthetic terms. Stage messages go to stderr; "
+                    "results go to stdout as JSON (or --output).",
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="student counts, e.g. 50 500 5000")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per size; the fastest time per stage is kept")
+    parser.add_argument("--engine", choices=ENGINES, default="greedy")
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--streaming", action="store_true")
+    parser.add_argument("--work-dir", default=WORK_DIR, help="where generated inputs and outputs are kept")
+    parser.add_argument("--output", metavar="PATH", help="write the results here instead of stdout")
+    parser.add_argument("--baseline", metavar="PATH", help="earlier results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="flag stages slower than the baseline by more than this fraction")
+    args = parser.parse_args(argv)
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "options": {"engine": args.engine, "jobs": args.jobs, "streaming": args.streaming,
+                    "seed": args.seed, "repeat": args.repeat},
+        "runs": [],
+    }
+    with contextlib.redirect_stdout(sys.stderr):
+        smallest = inputs_for(min(args.sizes), args.seed, args.work_dir)
+        check_fingerprints(smallest, os.path.dirname(smallest["teacher"]))
+        for size in args.sizes:
+            results["runs"].append(run_size(size, seed=args.seed, repeat=args.repeat, work_dir=args.work_dir,
+                                            engine=args.engine, jobs=args.jobs, streaming=args.streaming))
+
+    code = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("options") != results["options"]:
+            print("⚠️ Baseline was run with different options; timings may not be comparable", file=sys.stderr)
+        results["threshold"] = args.threshold
+        results["regressions"] = compare(results, baseline, args.threshold)
+        for regression in results["regressions"]:
+            print(f"⚠️ {regression['stage']} at {regression['size']} students: "
+                  f"{regression['baseline']}s -> {regression['seconds']}s", file=sys.stderr)
+        code = 1 if results["regressions"] else 0
+
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+import os
+import random
+from datetime import date, timedelta
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Border, Side
+
+TIMES = ["13:10～14:30", "14:40～16:00", "16:30～17:50", "18:00～19:20", "19:30～20:50"]
+WEEKDAYS = "月火水木金土日"
+GRADES = {"elementary": "小学生", "middle": "中学生", "high": "高校生"}
+GRADE_LABELS = {"elementary": ["小4", "小5", "小6"], "middle": ["中1", "中2", "中3"], "high": ["高1", "高2", "高3"]}
+SUBJECTS = {"elementary": ["国語", "算数", "理科"], "middle": ["英語", "数学", "国語", "理科"],
+            "high": ["英語", "数学", "国語", "物理", "化学"]}
+TEACHER_GIVEN_NAMES = ["花子", "太郎", "一郎", "美咲"]
+STUDENT_GIVEN_NAMES = ["凛", "結衣", "翔太", "陽菜", "葵", "蓮"]
+FULL_WIDTH = str.maketrans("0123456789", "０１２３４５６７８９")
+
+_CROSSED = Border(diagonal=Side(style="thin"), diagonalDown=True)
+
+
+def term_dates(first=date(2025, 3, 11), days=30):
+    """Tuesday-to-Saturday lecture dates from ``first``, like the spring term sheets."""
+    dates = []
+    day = first
+    while len(dates) < days:
+        if day.weekday() in (1, 2, 3, 4, 5):
+            dates.append(day)
+        day += timedelta(days=1)
+    return dates
+
+
+class Calendar_sheet:
+    """Rows of one calendar sheet: 5-day blocks of 8 rows, crossed-out (diagonal) cells are busy."""
+
+    def __init__(self, ws, title, label, name, dates, base_col, cells_per_day):
+        self.ws = ws
+        self.rows = {1: {1: title, base_col + 3: label, base_col + 5: name}}
+        self.crossed = set()
+        self.base_col = base_col
+        self.cells_per_day = cells_per_day
+        for block in range(-(-len(dates) // 5)):
+            top = 3 + block * 8
+            week = dates[block * 5:block * 5 + 5]
+            self.rows[top] = {1: f"{week[0].month}月".translate(FULL_WIDTH)}
+            self.rows[top + 1] = {}
+            for i, day in enumerate(week):
+                self.rows[top][base_col + i * 2] = f"{day.day}日"
+                self.rows[top + 1][base_col + i * 2] = WEEKDAYS[day.weekday()]
+            for t, time_label in enumerate(TIMES):
+                self.rows[top + 2 + t] = {1: time_label}
+
+    def cross(self, d, t, cell=None):
+        """Mark slot (date index, time index) busy: one cell, or every cell of the day."""
+        block, day = divmod(d, 5)
+        row = 3 + block * 8 + 2 + t
+        col = self.base_col + day * 2
+        cells = range(self.cells_per_day) if cell is None else [cell]
+        self.crossed.update((row, col + c) for c in cells)
+
+    def write(self):
+        last_col = self.base_col + 10
+        for row in range(1, max(self.rows) + 1):
+            values = self.rows.get(row, {})
+            line = []
+            for col in range(1, last_col + 1):
+                cell = WriteOnlyCell(self.ws, value=values.get(col))
+                if (row, col) in self.crossed:
+                    cell.border = _CROSSED
+                line.append(cell)
+            self.ws.append(line)
+
+
+def write_inputs(directory, students=50, teachers=None, seed=0, student_free=0.6, booth_free=0.7):
+    """Write a synthetic term into ``directory`` and return its paths.
+
+    One student calendar workbook per grade (a sheet per student, named
+    after the family name), one teacher workbook (a sheet per teacher, two
+    booth cells per slot) and a subject-match workbook. Busy slots are
+    crossed out with diagonal borders. The data is a pure function of the
+    arguments, so a size/seed pair always produces the same workbooks.
+    """
+    rng = random.Random(seed)
+    teachers = teachers or max(4, students // 3)
+    dates = term_dates()
+    os.makedirs(directory, exist_ok=True)
+
+    teacher_names = [f"講師{i:04d}　{rng.choice(TEACHER_GIVEN_NAMES)}" for i in range(teachers)]
+    teacher_path = os.path.join(directory, "teacher.xlsx")
+    wb = Workbook(write_only=True)
+    for name in teacher_names:
+        sheet = Calendar_sheet(wb.create_sheet(name.split("　")[0]), "２０２５年春期講習日程表", "講師名：", name,
+                               dates, base_col=3, cells_per_day=2)
+        for d in range(len(dates)):
+            for t in range(len(TIMES)):
+                for booth in range(2):
+                    if rng.random() >= booth_free:
+                        sheet.cross(d, t, booth)
+        sheet.write()
+    wb.save(teacher_path)
+
+    grades = list(GRADES)
+    by_grade = {grade: [] for grade in grades}
+    for i in range(students):
+        name = f"生徒{i:05d}　{rng.choice(STUDENT_GIVEN_NAMES)}"
+        by_grade[grades[i * len(grades) // students]].append(name)
+
+    student_paths = []
+    match_rows = []
+    for grade, names in by_grade.items():
+        if not names:
+            continue
+        path = os.path.join(directory, f"2025春期講習日程({GRADES[grade]}).xlsx")
+        wb = Workbook(write_only=True)
+        for name in names:
+            sheet = Calendar_sheet(wb.create_sheet(name.split("　")[0]), "２０２５年春期講習日程表", "生徒名：",
+                                   f"{name}　さん", dates, base_col=2, cells_per_day=2)
+            for d in range(len(dates)):
+                for t in range(len(TIMES)):
+                    if rng.random() >= student_free:
+                        sheet.cross(d, t)
+            sheet.write()
+            row = {"学年": rng.choice(GRADE_LABELS[grade]), "生徒名": name}
+            for n, subject in enumerate(rng.sample(SUBJECTS[grade], rng.randint(1, 3))):
+                suffix = f".{n}" if n else ""
+                row.update({f"教科{suffix}": subject, f"講師{suffix}": rng.choice(teacher_names),
+                            f"通常コマ数{suffix}": rng.choice([0, 4, 6, 8]),
+                            f"講習コマ数{suffix}": rng.choice([0, 0, 2, 3, 4])})
+            match_rows.append(row)
+        wb.save(path)
+        student_paths.append(path)
+
+    match_path = os.path.join(directory, "match.xlsx")
+    frame = pd.DataFrame(match_rows)
+    groups = max((len([c for c in row if c.startswith("教科")]) for row in match_rows), default=0)
+    columns = ["学年", "生徒名"] + [f"{header}{f'.{n}' if n else ''}" for n in range(groups)
+                                   for header in ("教科", "講師", "通常コマ数", "講習コマ数")]
+    frame = frame.reindex(columns=columns)
+    frame.columns = [column.split(".")[0] for column in columns]  # repeated headers, as in the real sheet
+    frame.to_excel(match_path, index=False)
+
+    return {"students": student_paths, "teacher": teacher_path, "match": match_path,
+            "dates": [day.isoformat() for day in dates]}
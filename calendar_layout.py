@@ -0,0 +1,147 @@
+import re
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+
+YEAR = 2025  # calendar sheets label days without a year
+
+_MONTH = re.compile(r"([0-9０-９]{1,2})月")
+_DAY = re.compile(r"\d{1,2}")
+_NON_DIGIT = re.compile(r"[^\d]")
+_TIME = re.compile(r"(\d{1,2})[:：](\d{2})")
+_FULL_WIDTH_DIGITS = str.maketrans("０１２３４５６７８９", "0123456789")
+
+
+@lru_cache(maxsize=None)
+def _month_of(text):
+    """Month number of a "N月" label, 0 if there is none."""
+    match = _MONTH.search(text)
+    return int(match.group(1).translate(_FULL_WIDTH_DIGITS)) if match else 0
+
+
+@lru_cache(maxsize=None)
+def _day_of(text):
+    """Day number of a day label, 0 if there is none."""
+    if not _DAY.search(text):
+        return 0
+    try:
+        return int(_NON_DIGIT.sub("", text))
+    except ValueError:
+        return 0
+
+
+@lru_cache(maxsize=None)
+def _time_of(text):
+    """"HH:MM" of a time label, "" if there is none."""
+    match = _TIME.match(text)
+    return f"{match[1].zfill(2)}:{match[2]}" if match else ""
+
+
+@lru_cache(maxsize=None)
+def _class_date(month, day):
+    try:
+        return datetime(YEAR, month, day).date()
+    except ValueError:
+        return None
+
+
+def _label_ufunc(parse, empty):
+    return np.frompyfunc(lambda value: parse(str(value)) if value else empty, 1, 1)
+
+
+_months = _label_ufunc(_month_of, 0)
+_days = _label_ufunc(_day_of, 0)
+_times = _label_ufunc(_time_of, "")
+
+
+def _as_array(values):
+    """``values`` as a 2-D object array indexed by 1-based (row, col); arrays pass through."""
+    if isinstance(values, np.ndarray):
+        return values
+    max_row = max((row for row, _ in values), default=0)
+    max_col = max((col for _, col in values), default=0)
+    grid = np.full((max_row + 1, max(max_col, 1) + 1), None, dtype=object)
+    if values:
+        cells = np.array(list(values), dtype=np.intp)
+        items = np.empty(len(values), dtype=object)
+        items[:] = list(values.values())
+        grid[cells[:, 0], cells[:, 1]] = items
+    return grid
+
+
+class Calendar_layout:
+    """Where every (date, time) slot sits on a calendar sheet.
+
+    Calendar sheets are made of blocks: a month row ("３月") with a day label
+    ("11日") every ``col_step`` columns from ``base_col``, followed by one row
+    per time slot, labelled in column A. The day column and the one after it
+    hold the slot's two cells (booths, or subject and type).
+
+    A layout is compiled once per sheet or template:
+
+    - ``slots``  (date, time, row, col) in sheet order: block, day column, time row
+    - ``cells``  (date, time) -> (row, col) of its first occurrence
+    - ``dates``  every labelled date, in sheet order
+    """
+
+    def __init__(self, slots, dates):
+        self.slots = slots
+        self.dates = dates
+        self.cells = {}
+        for date_str, time_str, row, col in slots:
+            self.cells.setdefault((date_str, time_str), (row, col))
+
+    def anchor(self, date_str, time_str):
+        """(row, col) of the slot's first cell, None when the sheet has no such slot."""
+        return self.cells.get((date_str, time_str))
+
+    @classmethod
+    def from_sheet(cls, values, base_col, col_step=2):
+        """Read the layout off a sheet's labels.
+
+        ``values`` maps (row, col) to cell values, or is a 2-D object array
+        indexed the same way (``Sheet_grid.to_arrays``). Any row whose
+        column A names a month starts a block, and the block's time rows are
+        the time-labelled rows up to the next one, so block height and slot
+        count follow the sheet. Labels are parsed over whole columns and
+        month rows at once; only the slot list is assembled in Python.
+        """
+        grid = _as_array(values)
+        column_a = grid[1:, 1]
+        months = _months(column_a).astype(int)
+        starts = np.flatnonzero(months) + 1
+        if not len(starts):
+            return cls([], [])
+        times = _times(column_a)
+        time_rows = np.flatnonzero((times != "") & (months == 0)) + 1
+        blocks = np.searchsorted(starts, time_rows, side="right") - 1  # block of each time row, -1 above the first
+        day_cols = np.arange(base_col, grid.shape[1], col_step)
+        days = _days(grid[starts[:, None], day_cols]).astype(int)  # (block, day column)
+
+        slots, dates = [], []
+        for b, month in enumerate(months[starts - 1].tolist()):
+            block_times = [(row, times[row - 1]) for row in time_rows[blocks == b].tolist()]
+            for c in np.flatnonzero(days[b]).tolist():
+                class_date = _class_date(month, int(days[b, c]))
+                if class_date is None:
+                    continue
+                date_str = class_date.isoformat()
+                col = int(day_cols[c])
+                dates.append(date_str)
+                slots.extend((date_str, time_str, row, col) for row, time_str in block_times)
+        return cls(slots, dates)
+
+    @classmethod
+    def from_dates(cls, dates, time_rows, base_col, block_rows=8, days_per_block=5, col_step=2):
+        """Lay ``dates`` out in order, ``days_per_block`` to a block of ``block_rows`` rows.
+
+        ``time_rows`` maps each time to its row in the first block.
+        """
+        dates = list(dates)
+        slots = []
+        for i, date_str in enumerate(dates):
+            block, day = divmod(i, days_per_block)
+            col = base_col + day * col_step
+            slots.extend((date_str, time_str, row + block * block_rows, col) for time_str, row in time_rows.items())
+        return cls(slots, dates)
@@ -0,0 +1,176 @@
+import argparse
+import contextlib
+import glob
+import json
+import os
+import sys
+import traceback
+
+from exclusions import EXCLUSIONS_PATH, Exclusions
+from instrumentation import Instrumentation
+from match_module import load_match
+from parse_cache import Parse_cache
+from pipeline import build_pipeline
+from schedule_result import ENGINES, Schedule_result
+from student_data import load_students
+from teacher_schedule import load_teachers
+
+EXIT_OK = 0
+EXIT_FAILED = 1  # a stage raised; the summary names it
+EXIT_USAGE = 2  # bad arguments or no input files matched
+
+
+def expand_paths(patterns):
+    """Files matching ``patterns`` (globs or plain paths), sorted per pattern, without repeats."""
+    paths = []
+    for pattern in patterns:
+        matches = [pattern] if os.path.isfile(pattern) else sorted(glob.glob(pattern, recursive=True))
+        paths.extend(path for path in matches if path not in paths)
+    return paths
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m cli",
+        description="Import the calendars, schedule and write the Excel outputs in one headless run. "
+                    "Stage messages go to stderr; a JSON summary goes to stdout (or --summary).",
+        epilog="Exit codes: 0 success, 1 a stage failed (the summary names it), "
+               "2 bad arguments or no input files matched.",
+    )
+    parser.add_argument("--students", nargs="+", required=True, metavar="GLOB",
+                        help="student calendar workbooks")
+    parser.add_argument("--teachers", nargs="+", required=True, metavar="GLOB",
+                        help="teacher calendar workbooks")
+    parser.add_argument("--match", required=True, metavar="PATH", help="teacher/lesson-count workbook")
+    parser.add_argument("--student-template", nargs="+", metavar="GLOB",
+                        help="student output templates (default: the student workbooks)")
+    parser.add_argument("--teacher-template", metavar="PATH",
+                        help="teacher output template (default: the first teacher workbook)")
+    parser.add_argument("--output-dir", default="output", help="directory for the output workbooks")
+    parser.add_argument("--engine", choices=ENGINES, default="greedy", help="scheduling engine (default greedy)")
+    parser.add_argument("--exclusions", default=EXCLUSIONS_PATH, metavar="PATH",
+                        help="closed date/time windows (default: the built-in ones if the file does not exist)")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="worker processes for every stage (default 1: small terms run faster serially)")
+    parser.add_argument("--import-jobs", type=int, help="worker processes for the importers (default --jobs)")
+    parser.add_argument("--schedule-jobs", type=int, help="worker processes for scheduling (default --jobs)")
+    parser.add_argument("--output-jobs", type=int, help="worker processes for the workbooks (default --jobs)")
+    parser.add_argument("--streaming", action="store_true", help="write the workbooks in write-only mode")
+    parser.add_argument("--cache-dir", default=".parse_cache", metavar="PATH",
+                        help="where parsed sheets are cached (default: .parse_cache in the working directory)")
+    parser.add_argument("--no-cache", action="store_true", help="parse every sheet, ignoring the parse cache")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only rerun the stages whose inputs changed since the last incremental run")
+    parser.add_argument("--summary", metavar="PATH", help="write the JSON summary here instead of stdout")
+    parser.add_argument("--report", metavar="PATH", help="write the full instrumentation report (every span) here")
+    return parser
+
+
+def run(args, summary, instrumentation):
+    """Run every stage inside an instrumentation span, recording counts in ``summary``.
+
+    The stages hand their data over in memory; besides ``--output-dir``,
+    only the parse cache is written (``--cache-dir``, none with ``--no-cache``).
+    """
+    import_jobs = args.import_jobs or args.jobs
+    cache = None if args.no_cache else Parse_cache(args.cache_dir)
+    exclusions = Exclusions.load(args.exclusions)
+    stages = summary["stages"]
+
+    def stage(name):
+        summary["stage"] = name
+        return instrumentation.span(name)
+
+    with stage("students"):
+        students = load_students(args.student_paths, jobs=import_jobs, cache=cache, exclusions=exclusions)
+    stages["students"] = {"files": len(args.student_paths), "students": len(students)}
+
+    with stage("teachers"):
+        teachers, dates = load_teachers(args.teacher_paths, jobs=import_jobs, cache=cache, exclusions=exclusions)
+    stages["teachers"] = {"files": len(args.teacher_paths), "teachers": len(teachers), "dates": len(dates)}
+
+    with stage("match"):
+        match = load_match(args.match, cache=cache)
+    stages["match"] = {"students": len(match)}
+
+    with stage("schedule"):
+        sr = Schedule_result(
+            students, teachers, match, args.student_template_paths, args.teacher_template, dates,
+            engine=args.engine, jobs=args.schedule_jobs or args.jobs, streaming=args.streaming,
+            instrumentation=instrumentation, exclusions=exclusions,
+        )
+        sr.teacher_output_path = os.path.join(args.output_dir, "teachers_schedule.xlsx")
+        sr.student_output_dirs = {category: os.path.join(args.output_dir, f"students_{category}.xlsx")
+                                  for category in sr.student_output_dirs}
+        sr.normalize_student_names()
+        sr.generate_schedule()
+    stages["schedule"] = {"entries": len(sr.schedule_data)}
+
+    with stage("output"):
+        sr.generate_outputs(args.output_jobs or args.jobs)
+    written = [path for path in [sr.teacher_output_path, *sr.student_output_dirs.values()] if os.path.exists(path)]
+    stages["output"] = {"files": written, "ambiguous_names": [list(item) for item in sr.ambiguous_names]}
+    summary.pop("stage")
+    return sr
+
+
+def run_incremental(args, summary, instrumentation):
+    """Run the stale stages of the pipeline DAG, recording which ran and which were skipped."""
+    summary["stage"] = "pipeline"
+    pipeline = build_pipeline(
+        args.student_paths, args.teacher_paths, args.match, args.student_template_paths, args.teacher_template,
+        output_dir=args.output_dir, engine=args.engine, import_jobs=args.import_jobs or args.jobs,
+        schedule_jobs=args.schedule_jobs or args.jobs, streaming=args.streaming,
+        cache=None if args.no_cache else Parse_cache(args.cache_dir), exclusions_path=args.exclusions,
+    )
+    result = pipeline.run(jobs=args.output_jobs or args.jobs, instrumentation=instrumentation)
+    for status in ("ran", "skipped"):
+        summary["stages"].update({name: {"status": status} for name in result[status]})
+    summary.pop("stage")
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    args.student_paths = expand_paths(args.students)
+    args.teacher_paths = expand_paths(args.teachers)
+    for option, paths in (("--students", args.student_paths), ("--teachers", args.teacher_paths)):
+        if not paths:
+            parser.print_usage(sys.stderr)
+            print(f"{parser.prog}: error: {option} matched no files", file=sys.stderr)
+            return EXIT_USAGE
+    if not os.path.isfile(args.match):
+        print(f"{parser.prog}: error: --match {args.match} does not exist", file=sys.stderr)
+        return EXIT_USAGE
+    args.student_template_paths = expand_paths(args.student_template) if args.student_template else args.student_paths
+    args.teacher_template = args.teacher_template or args.teacher_paths[0]
+
+    summary = {"status": "ok", "stages": {}}
+    instrumentation = Instrumentation()
+    code = EXIT_OK
+    try:
+        with contextlib.redirect_stdout(sys.stderr):  # keep stdout for the summary
+            (run_incremental if args.incremental else run)(args, summary, instrumentation)
+    except Exception as e:
+        traceback.print_exc()
+        summary.update(status="error", error=f"{type(e).__name__}: {e}")
+        code = EXIT_FAILED
+    report = instrumentation.report()
+    for span in report["spans"]:
+        if span["name"] in summary["stages"]:
+            summary["stages"][span["name"]].update(seconds=span["wall"], cpu_seconds=span["cpu"])
+    summary["scheduling"] = report["scheduling"]
+    if args.report:
+        instrumentation.save(args.report)
+
+    text = json.dumps(summary, ensure_ascii=False, indent=2)
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
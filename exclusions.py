@@ -0,0 +1,131 @@
+import json
+import os
+import re
+import unicodedata
+
+import numpy as np
+
+from name_registry import normalize_name
+
+EXCLUSIONS_PATH = "exclusions.json"
+WEEKDAYS = "月火水木金土日"  # Monday first, as date.weekday()
+DEFAULT_CONFIG = {
+    "centre": [
+        {"date": "2025-04-05", "start": "13:10", "end": "17:50"},
+        {"date": "2025-04-12", "start": "13:10", "end": "16:00"},
+    ],
+}
+
+_TIME = re.compile(r"(\d{1,2}):(\d{2})")
+_WHOLE_DAY = ("00:00", "23:59")
+
+
+def _minutes(text):
+    """Minutes since midnight of the first "H:MM" in ``text``, -1 if there is none."""
+    match = _TIME.search(unicodedata.normalize("NFKC", str(text)))
+    return int(match[1]) * 60 + int(match[2]) if match else -1
+
+
+def _weekday(value):
+    return WEEKDAYS.index(value) if isinstance(value, str) else int(value)
+
+
+class Exclusions:
+    """Closed (date, time) windows, compiled for vectorized masking.
+
+    Three kinds of window, each closing the slots whose start time lies in
+    ``[start, end]`` (both inclusive; the whole day when omitted):
+
+    - ``centre``    ``{"date", "start", "end"}``, closed for everyone
+    - ``weekdays``  ``{"weekday", "start", "end"}``, closed every week;
+      ``weekday`` is 0-6 from Monday or one of 月火水木金土日
+    - ``teachers``  ``{teacher name: [window, ...]}``, dated or weekly windows
+      that close only that teacher's slots
+
+    A window is held as (day number or -1, weekday or -1, start minute, end
+    minute), so the mask of any list of slots is a handful of array
+    comparisons, one per window.
+    """
+
+    def __init__(self, centre=(), weekdays=(), teachers=None):
+        self.common = np.array([self._window(w) for w in [*centre, *weekdays]], dtype=np.int64).reshape(-1, 4)
+        self.teachers = {
+            normalize_name(name): np.array([self._window(w) for w in windows], dtype=np.int64).reshape(-1, 4)
+            for name, windows in (teachers or {}).items()
+        }
+
+    @staticmethod
+    def _window(window):
+        start, end = window.get("start", _WHOLE_DAY[0]), window.get("end", _WHOLE_DAY[1])
+        if "weekday" in window:
+            return -1, _weekday(window["weekday"]), _minutes(start), _minutes(end)
+        return int(np.datetime64(window["date"], "D").astype(np.int64)), -1, _minutes(start), _minutes(end)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get("centre", ()), config.get("weekdays", ()), config.get("teachers"))
+
+    @classmethod
+    def load(cls, path=EXCLUSIONS_PATH):
+        """Windows from the JSON file at ``path``, or ``DEFAULT_CONFIG`` when there is none."""
+        if not os.path.exists(path):
+            return cls.from_config(DEFAULT_CONFIG)
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_config(json.load(f))
+
+    @staticmethod
+    def _hits(windows, days, weekdays, minutes):
+        hit = np.zeros(np.broadcast_shapes(days.shape, minutes.shape), dtype=bool)
+        for day, weekday, start, end in windows.tolist():
+            on_day = days == day if day >= 0 else weekdays == weekday
+            hit |= on_day & (minutes >= start) & (minutes <= end)
+        return hit
+
+    @staticmethod
+    def _slots(dates, times):
+        days = np.array(dates, dtype="datetime64[D]").astype(np.int64)
+        return days, (days + 3) % 7, np.array([_minutes(t) for t in times], dtype=np.int64)  # 1970-01-01 was a Thursday
+
+    def excluded(self, dates, times, teacher=None):
+        """Bool per (date, time) pair: the slot is closed (for ``teacher``, if given)."""
+        days, weekdays, minutes = self._slots(dates, times)
+        hit = self._hits(self.common, days, weekdays, minutes)
+        windows = self.teachers.get(normalize_name(teacher)) if teacher else None
+        if windows is not None:
+            hit |= self._hits(windows, days, weekdays, minutes)
+        return hit
+
+    def mask(self, dates, times, teachers=None):
+        """Closed slots of the (date, time) grid: (date, time), or (teacher, date, time) for ``teachers``."""
+        days, weekdays, minutes = self._slots(dates, times)
+        days, weekdays, minutes = days[:, None], weekdays[:, None], minutes[None, :]
+        closed = self._hits(self.common, days, weekdays, minutes)
+        if teachers is None:
+            return closed
+        stacked = np.repeat(closed[None], len(teachers), axis=0)
+        for k, name in enumerate(teachers):
+            windows = self.teachers.get(normalize_name(name))
+            if windows is not None:
+                stacked[k] |= self._hits(windows, days, weekdays, minutes)
+        return stacked
+
+    def drop(self, records, by_teacher=False):
+        """Imported ``records`` without their closed slots; records left with no slot are removed.
+
+        With ``by_teacher`` each record's own teacher windows apply as well.
+        """
+        kept = {}
+        for name, info in records.items():
+            slots = [(day, time) for day, times in info["schedule"].items() for time in times]
+            closed = self.excluded([day for day, _ in slots], [time for _, time in slots],
+                                   teacher=name if by_teacher else None) if slots else np.zeros(0, dtype=bool)
+            if not closed.any():
+                kept[name] = info
+                continue
+            schedule = {}
+            for (day, time), shut in zip(slots, closed.tolist()):
+                if not shut:
+                    schedule.setdefault(day, {})[time] = info["schedule"][day][time]
+            if schedule:
+                kept[name] = dict(info, schedule=schedule)
+        return kept
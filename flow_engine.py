@@ -0,0 +1,171 @@
+from heapq import heappop, heappush
+
+import numpy as np
+
+INF = float("inf")
+
+
+class Min_cost_flow:
+    """Min-cost max-flow over integer capacities and non-negative edge costs.
+
+    Primal-dual: Dijkstra with node potentials finds the next shortest path
+    length, then a Dinic blocking flow over the zero reduced-cost edges
+    saturates every path of that length before Dijkstra runs again.
+    Edges are stored in flat lists; edge ``e ^ 1`` is the reverse of ``e``.
+    """
+
+    def __init__(self):
+        self.adj = []
+        self.to = []
+        self.cap = []
+        self.cost = []
+
+    def add_node(self):
+        self.adj.append([])
+        return len(self.adj) - 1
+
+    def add_edge(self, u, v, cap, cost=0):
+        e = len(self.to)
+        self.to.extend((v, u))
+        self.cap.extend((cap, 0))
+        self.cost.extend((cost, -cost))
+        self.adj[u].append(e)
+        self.adj[v].append(e + 1)
+        return e
+
+    def flow(self, e):
+        return self.cap[e ^ 1]
+
+    def solve(self, source, sink):
+        n = len(self.adj)
+        adj, to, cap, cost = self.adj, self.to, self.cap, self.cost
+        potential = [0] * n
+        total_flow = total_cost = 0
+        while True:
+            # shortest reduced-cost distances from the source
+            dist = [INF] * n
+            dist[source] = 0
+            heap = [(0, source)]
+            while heap:
+                du, u = heappop(heap)
+                if du > dist[u]:
+                    continue
+                base = du + potential[u]
+                for e in adj[u]:
+                    if cap[e]:
+                        v = to[e]
+                        nd = base + cost[e] - potential[v]
+                        if nd < dist[v]:
+                            dist[v] = nd
+                            heappush(heap, (nd, v))
+            limit = dist[sink]
+            if limit == INF:
+                break
+            for v in range(n):
+                potential[v] += dist[v] if dist[v] < limit else limit
+            pushed = self._blocking_flows(source, sink, potential)
+            total_flow += pushed
+            total_cost += pushed * (potential[sink] - potential[source])
+        return total_flow, total_cost
+
+    def _blocking_flows(self, source, sink, potential):
+        n = len(self.adj)
+        adj, to, cap, cost = self.adj, self.to, self.cap, self.cost
+        pushed = 0
+        while True:
+            level = [-1] * n
+            level[source] = 0
+            queue = [source]
+            for u in queue:
+                if level[sink] >= 0 and level[u] >= level[sink]:
+                    break
+                pu = potential[u]
+                for e in adj[u]:
+                    v = to[e]
+                    if cap[e] and level[v] < 0 and cost[e] + pu == potential[v]:
+                        level[v] = level[u] + 1
+                        queue.append(v)
+            if level[sink] < 0:
+                return pushed
+            pointer = [0] * n
+            path = []
+            u = source
+            while True:
+                if u == sink:
+                    amount = min(cap[e] for e in path)
+                    for e in path:
+                        cap[e] -= amount
+                        cap[e ^ 1] += amount
+                    pushed += amount
+                    # resume from the tail of the first saturated edge
+                    cut = next(i for i, e in enumerate(path) if not cap[e])
+                    u = to[path[cut] ^ 1]
+                    del path[cut:]
+                    continue
+                edges = adj[u]
+                i = pointer[u]
+                end = len(edges)
+                next_level = level[u] + 1
+                pu = potential[u]
+                while i < end:
+                    e = edges[i]
+                    if cap[e]:
+                        v = to[e]
+                        if level[v] == next_level and cost[e] + pu == potential[v]:
+                            break
+                    i += 1
+                pointer[u] = i
+                if i < end:
+                    path.append(edges[i])
+                    u = to[edges[i]]
+                elif u == source:
+                    break
+                else:
+                    level[u] = -1
+                    e = path.pop()
+                    u = to[e ^ 1]
+                    pointer[u] += 1
+
+
+def plan_assignments(index, demands, slot_capacity):
+    """Choose lesson slots for every demand with one min-cost max-flow.
+
+    ``demands`` is a list of ``(s, k, count, window_days)`` on ``index`` ids.
+    The network is
+
+        source -> demand (cap count) -> demand window (cap 1)
+               -> teacher slot (cost = time rank) -> sink (cap open booths)
+
+    where a window groups ``window_days`` consecutive days, so a demand gets
+    at most one lesson per window. Student clashes across demands and exact
+    spacing rules are left to the caller. Returns, per demand, the sorted
+    ``(d, t)`` slots that carry flow.
+    """
+    graph = Min_cost_flow()
+    source = graph.add_node()
+    sink = graph.add_node()
+    slot_nodes = {}
+    demand_edges = []
+    for s, k, count, window_days in demands:
+        edges = []
+        demand_edges.append(edges)
+        open_dates, open_times = np.nonzero(index.open_mask(s, k, slot_capacity).any(axis=2))
+        if not len(open_dates):
+            continue
+        demand_node = graph.add_node()
+        graph.add_edge(source, demand_node, count)
+        windows = {}
+        for d, t in zip(open_dates.tolist(), open_times.tolist()):
+            window = index.day_numbers[d] // max(window_days, 1)
+            window_node = windows.get(window)
+            if window_node is None:
+                window_node = windows[window] = graph.add_node()
+                graph.add_edge(demand_node, window_node, 1)
+            slot_node = slot_nodes.get((k, d, t))
+            if slot_node is None:
+                slot_node = slot_nodes[(k, d, t)] = graph.add_node()
+                open_booths = int(index.teacher_free[k, d, t].sum())
+                graph.add_edge(slot_node, sink, min(open_booths, slot_capacity - int(index.teacher_load[k, d, t])))
+            edges.append((graph.add_edge(window_node, slot_node, 1, cost=t), d, t))
+    graph.solve(source, sink)
+    return [sorted((d, t) for e, d, t in edges if graph.flow(e)) for edges in demand_edges]
@@ -0,0 +1,120 @@
+import json
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+REJECTIONS = ("student_busy", "booth_taken", "slot_full")  # spacing rejections use the rule's name
+
+
+class Cancelled(Exception):
+    """Raised at the next progress checkpoint after ``Instrumentation.cancel``."""
+
+
+def _cpu_seconds():
+    """CPU time of this process plus its finished children (pool workers are counted once they exit)."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class Instrumentation:
+    """Timings, scheduling counters and progress of one pipeline run.
+
+    - ``span(name)``          times a block (wall and CPU seconds); spans nest
+    - ``probed``              (date, time) slots the scheduler looked at
+    - ``rejections``          why probed slots were not used: ``REJECTIONS`` or a spacing rule name
+    - ``unplaced_*``          lessons left unplaced, per teacher and per student
+
+    ``hook``, if given, is called with an event dict for every finished
+    span (``{"event": "span", ...}``) and for progress
+    (``{"event": "progress", "stage", "done", "total"}``, at most once per
+    percent). It runs on the thread doing the work.
+
+    ``cancel`` may be called from any thread; the work stops with
+    ``Cancelled`` at its next ``progress`` call (between sheets, demands or
+    pipeline stages).
+    """
+
+    def __init__(self, hook=None):
+        self.hook = hook
+        self.spans = []
+        self._open = []
+        self.probed = 0
+        self.placed = 0
+        self.rejections = Counter()
+        self.unplaced_by_teacher = Counter()
+        self.unplaced_by_student = Counter()
+        self.unresolved = 0  # demands whose student or teacher has no calendar
+        self._percent = {}
+        self.cancelled = False
+
+    @contextmanager
+    def span(self, name):
+        path = "/".join(self._open + [name])
+        self._open.append(name)
+        wall, cpu = time.perf_counter(), _cpu_seconds()
+        try:
+            yield
+        finally:
+            self._open.pop()
+            span = {"name": path, "wall": round(time.perf_counter() - wall, 4), "cpu": round(_cpu_seconds() - cpu, 4)}
+            self.spans.append(span)
+            self._emit(dict(span, event="span"))
+
+    def cancel(self):
+        self.cancelled = True
+
+    def check(self):
+        if self.cancelled:
+            raise Cancelled()
+
+    def progress(self, stage, done, total):
+        self.check()
+        percent = done * 100 // total if total else 100
+        if self._percent.get(stage) == percent and done != total:
+            return
+        self._percent[stage] = percent
+        self._emit({"event": "progress", "stage": stage, "done": done, "total": total})
+
+    def _emit(self, event):
+        if self.hook is not None:
+            self.hook(event)
+
+    def unplaced(self, teacher, student, lessons):
+        if lessons > 0:
+            self.unplaced_by_teacher[teacher] += lessons
+            self.unplaced_by_student[student] += lessons
+
+    def counters(self):
+        """The scheduling counters alone, as sent back by worker processes."""
+        return {
+            "probed": self.probed,
+            "placed": self.placed,
+            "rejections": dict(self.rejections),
+            "unplaced_by_teacher": dict(self.unplaced_by_teacher),
+            "unplaced_by_student": dict(self.unplaced_by_student),
+            "unresolved": self.unresolved,
+        }
+
+    def merge(self, counters):
+        self.probed += counters["probed"]
+        self.placed += counters["placed"]
+        self.rejections.update(counters["rejections"])
+        self.unplaced_by_teacher.update(counters["unplaced_by_teacher"])
+        self.unplaced_by_student.update(counters["unplaced_by_student"])
+        self.unresolved += counters["unresolved"]
+
+    def report(self):
+        return {
+            "spans": list(self.spans),
+            "scheduling": dict(
+                self.counters(),
+                unplaced=sum(self.unplaced_by_teacher.values()),
+                unplaced_by_teacher=dict(self.unplaced_by_teacher.most_common()),
+                unplaced_by_student=dict(self.unplaced_by_student.most_common()),
+            ),
+        }
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
@@ -1,25 +1,29 @@
 import os
-import json
-import threading
+import multiprocessing
 import traceback
+from concurrent.futures import ThreadPoolExecutor, wait
 from tkinter import filedialog, messagebox
 import customtkinter as ctk  # modern Tk replacement
 
-from student_data import Student_data
-from teacher_schedule import Teacher_data
-from match_module import match_basic
-from schedule_result import Schedule_result
+from instrumentation import Cancelled, Instrumentation
+from parallel_import import default_jobs
+from parse_cache import Parse_cache
+from pipeline import build_pipeline
 
 
 class MainDisplay:
     """GUI for the scheduling tool, styled with customtkinter.
 
     – Modern muted palette inspired by current‑gen Japanese web apps
-    – Indeterminate progress bar runs **smoothly** while long tasks run
-      thanks to background threading
+    – Imports and schedule generation run as jobs on one shared background
+      executor, so the window never blocks; several imports can be queued
+      at once and the 「キャンセル」 button stops them between sheets
+    – Progress events are marshalled back to the Tk thread with root.after
     – All user‑facing errors surface in message boxes (no hidden prints)
     """
 
+    MAX_JOBS       = 4              # background jobs running at once
+
     # ------------------------------------------------------------------ palette
     BG             = "#f3f6f9"
     CARD_BG        = "#ffffff"
@@ -33,7 +37,7 @@ class MainDisplay:
         self.root = ctk.CTk()
         self.root.title("スケジュール管理ツール")
         self.root.configure(fg_color=self.BG)
-        self._set_window_size(860, 290)
+        self._set_window_size(860, 380)
         self.root.resizable(False, False)
         ctk.set_appearance_mode("light")
         ctk.set_default_color_theme("blue")
@@ -48,6 +52,13 @@ class MainDisplay:
         self.match_json_path   = "all_students_schedule.json"
         self.stu_file_path: str | None = None
         self.teach_file_path: str | None = None
+        self.teach_file_paths: list[str] | None = None
+        self.match_file_path: str | None = None
+        self.jobs_var = ctk.StringVar(value=str(default_jobs()))
+        self.parse_cache = Parse_cache()  # unchanged sheets are not parsed again
+        self.executor = ThreadPoolExecutor(max_workers=self.MAX_JOBS, thread_name_prefix="job")
+        self.in_flight: list = []  # (key, future, Instrumentation) of queued and running jobs
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
 
         # ------------------------------ build UI
         self._build_layout()
@@ -98,98 +109,164 @@ class MainDisplay:
         self.btn_match.grid(row=1, column=0, padx=16, pady=12, sticky="ew")
         self.btn_exec.grid(row=1, column=1, padx=16, pady=12, sticky="ew")
 
-        # progress bar (indeterminate) --------------------------------
+        # worker count ------------------------------------------------
+        jobs_row = ctk.CTkFrame(card, fg_color="transparent")
+        jobs_row.grid(row=2, column=0, columnspan=2, padx=16, pady=(0, 12), sticky="w")
+        ctk.CTkLabel(jobs_row, text="並列処理数", font=self.jp_font).pack(side="left", padx=(0, 8))
+        ctk.CTkOptionMenu(
+            jobs_row,
+            variable=self.jobs_var,
+            values=[str(n) for n in range(1, default_jobs() + 1)],
+            font=self.jp_font,
+            width=80,
+        ).pack(side="left")
+        self.btn_cancel = ctk.CTkButton(jobs_row, text="キャンセル", font=self.jp_font, width=100,
+                                        state="disabled", command=self._on_cancel_click)
+        self.btn_cancel.pack(side="left", padx=(24, 0))
+
+        # progress bar + status ----------------------------------------
         self.progress = ctk.CTkProgressBar(self.root, width=600, height=8, corner_radius=4, mode="indeterminate")
         self.progress.pack(pady=(12, 0))
         self.progress.pack_forget()
+        self.status = ctk.CTkLabel(self.root, text="", font=self.jp_font)
+        self.status.pack(pady=(4, 0))
 
     # ------------------------------------------------ progress helpers
     def _show_progress(self, msg: str | None = None):
         if msg:
             print(msg)
+            self.status.configure(text=msg)
+        self.progress.stop()
+        self.progress.configure(mode="indeterminate")
         self.progress.set(0)
-        self.progress.pack(pady=(12, 0))
+        self.progress.pack(pady=(12, 0), before=self.status)
         self.progress.start()
-        self.root.update_idletasks()
+        self.btn_cancel.configure(state="normal")
 
-    def _hide_progress(self):
+    def _hide_progress(self, msg: str = ""):
         self.progress.stop()
         self.progress.pack_forget()
-        self.root.update_idletasks()
+        self.status.configure(text=msg)
+        self.btn_cancel.configure(state="disabled")
+
+    def _on_progress(self, msg: str, event: dict):
+        """Tk thread: show a job's progress event as a determinate bar."""
+        if event["event"] != "progress" or not self.in_flight:
+            return
+        self.progress.stop()
+        self.progress.configure(mode="determinate")
+        self.progress.set(event["done"] / event["total"] if event["total"] else 1)
+        self.status.configure(text=f"{msg}（{event['stage']} {event['done']}/{event['total']}）")
+
+    @property
+    def jobs(self) -> int:
+        return int(self.jobs_var.get())
 
     # ================================================= button callbacks
     def _on_student_click(self):
-        self._show_progress("生徒スケジュール取込中 …")
         paths = filedialog.askopenfilenames(initialdir=os.path.join(os.getcwd(), "input"),
                                             title="生徒スケジュールを選択", filetypes=[("Excel Files", "*.xlsx")])
         if paths:
             self.stu_file_path = paths
-            Student_data(paths)
-        self._hide_progress()
+            pipeline = self._pipeline(self.jobs)
+            self._submit("students", "生徒スケジュール取込中 …",
+                         lambda stats: pipeline.run(["students"], instrumentation=stats))
 
     def _on_teacher_click(self):
-        self._show_progress("講師スケジュール取込中 …")
-        path = filedialog.askopenfilename(initialdir=os.path.join(os.getcwd(), "input"),
-                                          title="講師スケジュールを選択", filetypes=[("Excel Files", "*.xlsx")])
-        if path:
-            self.teach_file_path = path
-            Teacher_data(path)
-        self._hide_progress()
+        paths = filedialog.askopenfilenames(initialdir=os.path.join(os.getcwd(), "input"),
+                                            title="講師スケジュールを選択", filetypes=[("Excel Files", "*.xlsx")])
+        if paths:
+            self.teach_file_path = paths[0]  # first workbook doubles as the output template
+            self.teach_file_paths = list(paths)
+            pipeline = self._pipeline(self.jobs)
+            self._submit("teachers", "講師スケジュール取込中 …",
+                         lambda stats: pipeline.run(["teachers"], instrumentation=stats))
 
     def _on_match_click(self):
-        self._show_progress("マッチデータ読込中 …")
         path = filedialog.askopenfilename(initialdir=os.path.join(os.getcwd(), "input"),
                                           title="科目マッチ用Excelを選択", filetypes=[("Excel Files", "*.xlsx")])
         if path:
-            match_basic(path)
-        self._hide_progress()
+            self.match_file_path = path
+            pipeline = self._pipeline(self.jobs)
+            self._submit("match", "マッチデータ読込中 …",
+                         lambda stats: pipeline.run(["match"], instrumentation=stats))
+
+    def _on_cancel_click(self):
+        for _, future, stats in self.in_flight:
+            future.cancel()  # not started yet: never runs
+            stats.cancel()  # running: stops at its next sheet, demand or stage
+        self.status.configure(text="キャンセル中 …")
 
     # ------------------------------------------------ long‑running task
     def _on_execute_click(self):
-        # UI: show progress and spawn worker thread
-        self._show_progress("スケジュール生成中 …")
-        worker = threading.Thread(target=self._execute_schedule_task, daemon=True)
-        worker.start()
-
-    def _execute_schedule_task(self):
-        """Runs in a background thread; schedules Excel generation."""
-        try:
-            # prerequisite JSONs
-            if not all(map(os.path.exists, (self.student_json_path, self.teacher_json_path, self.match_json_path))):
-                raise FileNotFoundError("必要なJSONファイルが見つかりません。まず各取込を行ってください。")
-
-            with open(self.student_json_path, "r", encoding="utf-8") as f:
-                student_data = json.load(f)
-            with open(self.teacher_json_path, "r", encoding="utf-8") as f:
-                teacher_data = json.load(f)
-            with open(self.match_json_path, "r", encoding="utf-8") as f:
-                match_data = json.load(f)
-
-            lecture_dates = []
-            if os.path.exists("lecture_dates.json"):
-                with open("lecture_dates.json", "r", encoding="utf-8") as f:
-                    lecture_dates = json.load(f)
-
-            sr = Schedule_result(
-                student_data=student_data,
-                teacher_data=teacher_data,
-                match_data=match_data,
-                student_template=self.stu_file_path or "./templete/student_templete.xlsx",
-                teacher_template=self.teach_file_path or "./templete/teacher_templete.xlsx",
-                date_list=lecture_dates,
-            )
-            sr.run()
-
-            # success message via main thread
-            self.root.after(0, lambda: messagebox.showinfo("完了", "✅ スケジュール作成が成功しました！出力ファイルが保存されました。"))
-        except Exception as e:
-            err = f"❌ エラーが発生しました:\n{str(e)}\n\n詳細:\n{traceback.format_exc()}"
-            self.root.after(0, lambda: messagebox.showerror("エラー", err))
-        finally:
-            # stop progress bar in main thread
-            self.root.after(0, self._hide_progress)
+        jobs = self.jobs
+        pipeline = self._pipeline(jobs)
+        self._submit("schedule", "スケジュール生成中 …",
+                     lambda stats: self._execute_schedule_task(pipeline, jobs, stats))
+
+    def _execute_schedule_task(self, pipeline, jobs: int, stats: Instrumentation):
+        """Runs on the executor; schedules Excel generation."""
+        # prerequisite JSONs
+        if not all(map(os.path.exists, (self.student_json_path, self.teacher_json_path, self.match_json_path))):
+            raise FileNotFoundError("必要なJSONファイルが見つかりません。まず各取込を行ってください。")
+
+        # re-imports changed workbooks; scheduling and workbooks only rerun when their inputs changed
+        pipeline.run(jobs=jobs, instrumentation=stats)
+        return "✅ スケジュール作成が成功しました！出力ファイルが保存されました。"
+
+    # ------------------------------------------------ background jobs
+    def _submit(self, key: str, msg: str, work):
+        """Queue ``work(stats)`` on the shared executor.
+
+        A job starts after the queued jobs with the same key; "schedule"
+        starts after every queued job, since it reads what the imports write.
+        Progress events and the outcome come back to the Tk thread through
+        root.after.
+        """
+        earlier = [future for k, future, _ in self.in_flight if k == key or key == "schedule"]
+        stats = Instrumentation(hook=lambda event: self.root.after(0, self._on_progress, msg, event))
+
+        def job():
+            wait(earlier)
+            stats.check()
+            return work(stats)
+
+        entry = (key, self.executor.submit(job), stats)
+        self.in_flight.append(entry)
+        self._show_progress(msg)
+        entry[1].add_done_callback(lambda future: self.root.after(0, self._on_job_done, entry))
+
+    def _on_job_done(self, entry):
+        """Tk thread: report a finished job and hide the progress bar once the queue is empty."""
+        self.in_flight.remove(entry)
+        _, future, _ = entry
+        status = ""
+        if future.cancelled() or isinstance(future.exception(), Cancelled):
+            status = "キャンセルしました"
+        elif future.exception() is not None:
+            e = future.exception()
+            details = "".join(traceback.format_exception(type(e), e, e.__traceback__))
+            messagebox.showerror("エラー", f"❌ エラーが発生しました:\n{str(e)}\n\n詳細:\n{details}")
+        elif future.result() and isinstance(future.result(), str):
+            messagebox.showinfo("完了", future.result())
+        if not self.in_flight:
+            self._hide_progress(status)
+
+    def _on_close(self):
+        self._on_cancel_click()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.root.destroy()
 
     # ================================================================= helpers
+    def _pipeline(self, jobs: int):
+        """Stage DAG over the selected workbooks; unselected imports use their JSON files."""
+        return build_pipeline(
+            self.stu_file_path, self.teach_file_paths, self.match_file_path,
+            student_templates=self.stu_file_path or "./templete/student_templete.xlsx",
+            teacher_template=self.teach_file_path or "./templete/teacher_templete.xlsx",
+            import_jobs=jobs, schedule_jobs=jobs, cache=self.parse_cache,
+        )
+
     def _set_window_size(self, w: int, h: int):
         sw, sh = self.root.winfo_screenwidth(), self.root.winfo_screenheight()
         x, y = int(sw / 2 - w / 2), int(sh / 2 - h / 2)
@@ -198,4 +275,5 @@ class MainDisplay:
 
 # ------------------------------------------------------------------ run GUI
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # worker processes in the frozen (PyInstaller) build
     MainDisplay()
@@ -2,9 +2,32 @@ import json
 from collections import defaultdict
 import pandas as pd
 import os
+import re
 from dataclasses import dataclass, asdict
 from typing import List, Optional
 
+from xlsx_stream import Xlsx_stream
+
+PARSER_VERSION = 2  # bump when the parsed output changes; invalidates cached sheets
+
+# header of each column in a subject group -> Subject field
+SUBJECT_FIELDS = {"教科": "name", "講師": "teacher", "通常コマ数": "regular_classes", "講習コマ数": "special_classes"}
+_SUBJECT_HEADER = re.compile(r"^教科(?:\.(\d+))?$")
+
+
+def subject_groups(columns):
+    """Header suffixes ("", ".1", ".2", ...) of the subject column groups, in order.
+
+    pandas numbers repeated headers, so the n-th 教科/講師/通常コマ数/講習コマ数
+    block of a sheet carries the suffix ".n"; any number of blocks is found.
+    """
+    found = []
+    for column in columns:
+        match = _SUBJECT_HEADER.match(str(column))
+        if match:
+            found.append(int(match[1] or 0))
+    return ["" if n == 0 else f".{n}" for n in sorted(found)]
+
 
 @dataclass
 class Subject:
@@ -21,61 +44,95 @@ class Student:
     subjects: List[Subject]
 
 
+def load_match(path, cache=None, json_path=None, instrumentation=None):
+    """Parse the subject-match workbook into student records, also written to ``json_path`` if given."""
+    return match_basic(path, cache=cache, json_path=json_path, instrumentation=instrumentation).data
+
+
 class match_basic:
-    def __init__(self, match_file_path) -> None:
+    def __init__(self, match_file_path, cache=None, json_path="all_students_schedule.json",
+                 instrumentation=None) -> None:
         self.match_file_path = match_file_path  # Single file path
+        self.cache = cache  # optional Parse_cache
+        self.json_path = json_path  # None keeps the records in memory only
+        self.instrumentation = instrumentation  # optional: progress once the workbook is read, cancellation
+        self.data = []  # student records, as written to all_students_schedule.json
         self.match_main()
 
-    def _read_path(self, path) -> None:
-        self.xls = pd.ExcelFile(path)
-        self.sheet_names = self.xls.sheet_names
-
     def extract_schedule_match_blocks(self, file_path):
-        results = []
-        self._read_path(file_path)
-
-        for sheet_name in self.sheet_names:
-            df = pd.read_excel(file_path, sheet_name=sheet_name)
-
-            for _, row in df.iterrows():
-                student_name = row.get("生徒名")
-                grade = row.get("学年", "不明")
-
-                if pd.isna(student_name):
-                    continue
-
-                subjects = []
-                subject_columns = [
-                    ("教科", "講師", "通常コマ数", "講習コマ数"),
-                    ("教科.1", "講師.1", "通常コマ数.1", "講習コマ数.1"),
-                    ("教科.2", "講師.2", "通常コマ数.2", "講習コマ数.2"),
-                    ("教科.3", "講師.3", "通常コマ数.3", "講習コマ数.3"),
-                    ("教科.4", "講師.4", "通常コマ数.4", "講習コマ数.4"),
+        cache = self.cache
+        blocks = {}
+
+        with Xlsx_stream(file_path) as book:
+            self.sheet_names = book.sheet_names
+            keys = {name: cache.key("match", PARSER_VERSION, book, name) for name in self.sheet_names} if cache else {}
+        for sheet_name, key in keys.items():
+            block = cache.get(key)
+            if block is not None:
+                blocks[sheet_name] = [
+                    Student(**dict(student, subjects=[Subject(**subject) for subject in student["subjects"]]))
+                    for student in block
                 ]
 
-                for cols in subject_columns:
-                    sub_name = row.get(cols[0])
-                    if pd.notna(sub_name):
-                        subject = Subject(
-                            name=sub_name,
-                            teacher=row.get(cols[1]) if pd.notna(row.get(cols[1])) else None,
-                            regular_classes=int(row.get(cols[2]) or 0),
-                            special_classes=int(row.get(cols[3]) or 0)
-                        )
-                        subjects.append(subject)
-
-                student = Student(
-                    grade=grade,
-                    student_name=student_name,
-                    subjects=subjects
-                )
-                results.append(student)
-
-        return results
+        # one read for every sheet that is not cached
+        missing = [name for name in self.sheet_names if name not in blocks]
+        if missing:
+            for sheet_name, df in pd.read_excel(file_path, sheet_name=missing).items():
+                blocks[sheet_name] = self._extract_sheet(df)
+                if cache:
+                    cache.put(keys[sheet_name], [asdict(student) for student in blocks[sheet_name]])
+
+        return [student for name in self.sheet_names for student in blocks[name]]
+
+    def _extract_sheet(self, df):
+        if "生徒名" not in df.columns:
+            return []
+        df = df.reset_index(drop=True)
+        rows = df.index[df["生徒名"].notna()].tolist()
+        grades = df["学年"].astype(object).tolist() if "学年" in df.columns else ["不明"] * len(df)
+        names = df["生徒名"].astype(object).tolist()
+        subjects = defaultdict(list)
+
+        groups = subject_groups(df.columns)
+        if groups:
+            for row, subject in self._stack_subjects(df, groups, rows):
+                subjects[row].append(subject)
+
+        return [Student(grade=grades[row], student_name=names[row], subjects=subjects[row]) for row in rows]
+
+    def _stack_subjects(self, df, groups, rows):
+        """Yield (row, Subject) for every filled subject group, by row then group."""
+        # stack the groups into one long frame: (group, row) -> Subject fields
+        long = pd.concat(
+            [df.reindex(columns=[header + suffix for header in SUBJECT_FIELDS]).set_axis(list(SUBJECT_FIELDS.values()), axis=1)
+             for suffix in groups],
+            keys=range(len(groups)), names=["group", "row"],
+        )
+        long = long[long["name"].notna()].reset_index()
+        long = long[long["row"].isin(rows)].sort_values(["row", "group"], kind="stable")
+
+        teachers = long["teacher"].astype(object)
+        columns = zip(
+            long["row"].tolist(),
+            long["name"].tolist(),
+            teachers.where(teachers.notna(), None).tolist(),
+            long["regular_classes"].fillna(0).astype(int).tolist(),
+            long["special_classes"].fillna(0).astype(int).tolist(),
+        )
+        for row, name, teacher, regular, special in columns:
+            yield row, Subject(name=name, teacher=teacher, regular_classes=regular, special_classes=special)
 
     def match_main(self):
         if os.path.exists(self.match_file_path):
+            if self.cache:
+                self.cache.prune("match", PARSER_VERSION)
             students = self.extract_schedule_match_blocks(self.match_file_path)
+            if self.instrumentation:
+                self.instrumentation.progress("import_match", 1, 1)
+            if self.cache:
+                self.cache.evict()
             all_data = [asdict(student) for student in students]
-            with open("all_students_schedule.json", "w", encoding="utf-8") as f:
-                json.dump(all_data, f, ensure_ascii=False, indent=2)
+            self.data = all_data
+            if self.json_path:
+                with open(self.json_path, "w", encoding="utf-8") as f:
+                    json.dump(all_data, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,79 @@
+import unicodedata
+from collections import defaultdict
+from functools import lru_cache
+
+
+@lru_cache(maxsize=4096)  # bounded: a long GUI session sees many workbook and sheet names
+def normalize_name(name):
+    # Convert full-width to half-width, strip, remove extra spaces
+    name = unicodedata.normalize("NFKC", name)
+    name = name.replace("　", " ")  # full-width space to half-width
+    name = " ".join(name.strip().split())  # remove double spaces
+    return name
+
+
+def _substrings(text):
+    return {text[i:j] for i in range(len(text)) for j in range(i + 1, len(text) + 1)}
+
+
+class Name_registry:
+    """Resolves people to template sheets through prebuilt indexes.
+
+    ``sheets`` is an iterable of ``(key, sheet_name)`` in priority order;
+    ``resolve`` returns one of these pairs. Sheet names are normalized once
+    and indexed by exact name and by every substring, so each rule below is
+    a dict lookup. Candidates are ranked:
+
+    0. the sheet is the full name (with or without the space)
+    1. the sheet is the family name (first name part)
+    2. the sheet name is contained in the name (or, with ``match_parts``,
+       the name is contained in the sheet name)
+    3. with ``match_parts``: some name part is contained in the sheet name
+
+    The best rank wins, ties go to the earliest sheet. Each person is
+    resolved once; ties are recorded in ``ambiguous`` as
+    ``(name, chosen sheet, candidate sheets)``.
+    """
+
+    def __init__(self, sheets):
+        self.sheets = list(sheets)
+        self.exact = defaultdict(list)
+        self.containing = defaultdict(list)  # substring -> sheets whose name contains it
+        for pos, (_, sheet_name) in enumerate(self.sheets):
+            normalized = normalize_name(sheet_name)
+            self.exact[normalized].append(pos)
+            for part in _substrings(normalized):
+                self.containing[part].append(pos)
+        self.person_ids = {}  # normalized name -> canonical id
+        self.resolved = {}  # (person id, match_parts) -> (key, sheet_name) or None
+        self.ambiguous = []
+
+    def person_id(self, name):
+        return self.person_ids.setdefault(normalize_name(name), len(self.person_ids))
+
+    def _ranked_candidates(self, name, match_parts):
+        compact = name.replace(" ", "")
+        parts = name.split()
+        yield self.exact.get(name, []) + self.exact.get(compact, [])
+        yield self.exact.get(parts[0], []) if len(parts) > 1 else []
+        inside = [pos for part in _substrings(name) | _substrings(compact) for pos in self.exact.get(part, ())]
+        if match_parts:
+            inside += self.containing.get(name, []) + self.containing.get(compact, [])
+        yield inside
+        if match_parts:
+            yield [pos for part in parts for pos in self.containing.get(part, ())]
+
+    def resolve(self, name, match_parts=False):
+        key = (self.person_id(name), match_parts)
+        if key not in self.resolved:
+            match = None
+            normalized = normalize_name(name)
+            for candidates in self._ranked_candidates(normalized, match_parts):
+                if candidates:
+                    positions = sorted(set(candidates))
+                    match = self.sheets[positions[0]]
+                    if len(positions) > 1:
+                        self.ambiguous.append((normalized, match[1], [self.sheets[p][1] for p in positions]))
+                    break
+            self.resolved[key] = match
+        return self.resolved[key]
@@ -0,0 +1,74 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from xlsx_stream import sheet_names
+
+
+def default_jobs():
+    return os.cpu_count() or 1
+
+
+def merge_schedules(all_data, data):
+    """Merge per-person schedule records into ``all_data``.
+
+    The first record seen for a name is kept; the slots of later records are
+    merged into it date by date, the way ``Student_data.stu_main`` always did.
+    """
+    for name, info in data.items():
+        if name not in all_data:
+            all_data[name] = info
+        else:
+            for date, slots in info["schedule"].items():
+                if date not in all_data[name]["schedule"]:
+                    all_data[name]["schedule"][date] = slots
+                else:
+                    all_data[name]["schedule"][date].update(slots)
+    return all_data
+
+
+def plan_tasks(paths, jobs):
+    """Split workbooks into ``(path, sheets)`` parse tasks.
+
+    One task per workbook (``sheets`` is None) unless there are fewer
+    workbooks than jobs, in which case each workbook is cut into contiguous
+    sheet groups. Tasks keep file and sheet order, so merging their results in
+    order gives the same data as a serial parse.
+    """
+    paths = list(paths)
+    if jobs <= 1 or len(paths) >= jobs:
+        return [(path, None) for path in paths]
+    groups_per_file = -(-jobs // len(paths))
+    tasks = []
+    for path in paths:
+        names = sheet_names(path)
+        size = max(1, -(-len(names) // groups_per_file))
+        tasks.extend((path, names[i:i + size]) for i in range(0, len(names), size))
+    return tasks
+
+
+def run_tasks(worker, tasks, jobs, progress=None):
+    """Run ``worker`` over ``tasks`` in a process pool; results keep task order.
+
+    Fails fast: the first task error is raised as soon as it is seen and
+    tasks that have not started yet are cancelled. ``progress(done, total)``
+    is called in this process after each finished task; an exception it
+    raises stops the run the same way.
+    """
+    if jobs <= 1 or len(tasks) <= 1:
+        results = []
+        for task in tasks:
+            results.append(worker(task))
+            if progress:
+                progress(len(results), len(tasks))
+        return results
+    pool = ProcessPoolExecutor(max_workers=min(jobs, len(tasks)))
+    try:
+        futures = [pool.submit(worker, task) for task in tasks]
+        for done, future in enumerate(as_completed(futures), 1):
+            if future.exception() is not None:
+                raise future.exception()
+            if progress:
+                progress(done, len(tasks))
+        return [future.result() for future in futures]
+    finally:
+        pool.shutdown(cancel_futures=True)
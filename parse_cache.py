@@ -0,0 +1,82 @@
+import json
+import os
+
+
+class Parse_cache:
+    """On-disk cache of parsed sheet blocks, addressed by sheet content.
+
+    Keys are ``<kind>-v<parser version>-<sheet fingerprint>``; a parser
+    version bump therefore misses every old entry, and ``prune`` deletes
+    them. Entries are JSON files; reads refresh their mtime and ``evict``
+    removes the least recently used ones until the directory fits in
+    ``max_bytes``.
+    """
+
+    def __init__(self, directory=".parse_cache", max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, kind, version, book, sheet_name):
+        return f"{kind}-v{version}-{book.sheet_fingerprint(sheet_name)}"
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def _entries(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return [os.path.join(self.directory, name) for name in names if name.endswith(".json")]
+
+    def prune(self, kind, version):
+        """Delete entries of ``kind`` written by any other parser version."""
+        current = f"{kind}-v{version}-"
+        for path in self._entries():
+            name = os.path.basename(path)
+            if name.startswith(f"{kind}-v") and not name.startswith(current):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in ``max_bytes``."""
+        entries = []
+        for path in self._entries():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
@@ -0,0 +1,41 @@
+def find_components(demands):
+    """Group demands into connected components of the student–teacher graph.
+
+    ``demands`` are the ``(student, demand)`` pairs built from
+    all_students_schedule.json by ``Schedule_result._collect_demands``.
+    Returns lists of demand positions; components are ordered by their first
+    demand, positions keep their original order.
+    """
+    parent = {}
+
+    def find(node):
+        parent.setdefault(node, node)
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for student, demand in demands:
+        a, b = find(("student", student)), find(("teacher", demand['teacher']))
+        if a != b:
+            parent[b] = a
+
+    groups = {}
+    for pos, (student, _) in enumerate(demands):
+        groups.setdefault(find(("student", student)), []).append(pos)
+    return list(groups.values())
+
+
+def pack_components(components, bins, weight=len):
+    """Pack components into at most ``bins`` groups of similar total weight.
+
+    Largest component first into the lightest bin; the result is
+    deterministic and each group keeps positions in ascending order.
+    """
+    loads = [(0, i) for i in range(max(1, min(bins, len(components))))]
+    packed = [[] for _ in loads]
+    for component in sorted(components, key=lambda c: (-weight(c), c[0])):
+        load, i = min(loads)
+        packed[i].extend(component)
+        loads[i] = (load + weight(component), i)
+    return [sorted(group) for group in packed if group]
@@ -0,0 +1,284 @@
+import hashlib
+import json
+import os
+import threading
+from collections import namedtuple
+from contextlib import nullcontext
+from functools import partial
+
+import match_module
+import student_data
+import teacher_schedule
+from exclusions import EXCLUSIONS_PATH, Exclusions
+from match_module import load_match
+from parallel_import import run_tasks
+from schedule_result import Schedule_result
+from spacing_calendar import DEFAULT_SPACING_RULES
+from student_data import load_students
+from teacher_schedule import load_teachers
+
+PIPELINE_VERSION = 1  # bump when a stage's outputs change for the same inputs; reruns every stage
+STATE_PATH = ".pipeline_state.json"
+SCHEDULE_PATH = "schedule_data.json"
+JSON_FILES = {  # the importers' outputs, under work_dir
+    "student": "student_schedules.json",
+    "teacher": "teacher_diagonal_schedule.json",
+    "match": "all_students_schedule.json",
+    "dates": "lecture_dates.json",
+}
+CATEGORIES = ("elementary", "middle", "high")
+
+Stage = namedtuple("Stage", "name action args inputs outputs params parallel uses")
+
+_STATE_LOCK = threading.Lock()  # pipelines sharing a state file in this process save one at a time
+
+
+def _call(task):
+    """Worker entry point: run one stage's action, with the results of the upstream stages it uses."""
+    stage, upstream = task
+    return stage.action(*stage.args, **upstream)
+
+
+class Pipeline:
+    """Stages wired into a DAG by the files they read and write, rerun only when stale.
+
+    A stage depends on whichever stage lists one of its ``inputs`` among its
+    ``outputs``; files nobody produces are sources. Before a stage runs, its
+    fingerprint is taken over its parameters and the content of its inputs
+    (upstream stages have already run by then). The stage is skipped when
+    the fingerprint and the content of its outputs match the last successful
+    run recorded in ``state_path``, so an upstream rerun that writes the same
+    bytes stops there. Content digests are kept per (size, mtime) and only
+    recomputed when a file changes.
+
+    An action's return value is handed in memory to the stages that name
+    it in ``uses``, as a keyword argument called after the stage. A stage
+    that was skipped has no result this run, so its consumer gets None
+    and reads the upstream files instead. Actions run in this process also
+    get the run's ``instrumentation`` keyword (None in worker processes),
+    for progress and cancellation.
+    """
+
+    def __init__(self, state_path=STATE_PATH):
+        self.state_path = state_path
+        self.stages = {}
+        self.state = self._read_state()
+        self._recorded = set()  # stages this instance ran, merged into the file by save()
+
+    def _read_state(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        state.setdefault("files", {})
+        state.setdefault("stages", {})
+        return state
+
+    def add(self, name, action, args=(), inputs=(), outputs=(), params=None, parallel=False, uses=()):
+        """Add a stage. ``parallel`` stages must be picklable; they may run in worker processes."""
+        if name in self.stages:
+            raise ValueError(f"duplicate stage {name!r}")
+        self.stages[name] = Stage(name, action, tuple(args), [os.path.normpath(p) for p in inputs if p],
+                                  [os.path.normpath(p) for p in outputs], params, parallel, tuple(uses))
+
+    def _levels(self, targets=None):
+        """Stage names grouped by depth: each group only depends on earlier groups."""
+        producers = {}
+        for stage in self.stages.values():
+            for path in stage.outputs:
+                if path in producers:
+                    raise ValueError(f"{path} is an output of both {producers[path]!r} and {stage.name!r}")
+                producers[path] = stage.name
+        deps = {name: {producers[p] for p in stage.inputs if p in producers} for name, stage in self.stages.items()}
+
+        wanted = set(self.stages if targets is None else targets)
+        pending = list(wanted)
+        while pending:
+            for dep in deps[pending.pop()]:
+                if dep not in wanted:
+                    wanted.add(dep)
+                    pending.append(dep)
+
+        depth = {}
+        while len(depth) < len(wanted):
+            ready = [name for name in self.stages if name in wanted and name not in depth
+                     and all(dep in depth for dep in deps[name])]
+            if not ready:
+                raise ValueError(f"stages form a cycle: {sorted(wanted - set(depth))}")
+            for name in ready:
+                depth[name] = 1 + max((depth[dep] for dep in deps[name]), default=0)
+        levels = {}
+        for name, level in depth.items():
+            levels.setdefault(level, []).append(name)
+        return [levels[level] for level in sorted(levels)]
+
+    def digest(self, path):
+        """SHA-256 of a file's content, or None if it does not exist."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        known = self.state["files"].get(path)
+        if known and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return known[2]
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+        self.state["files"][path] = [stat.st_size, stat.st_mtime_ns, sha.hexdigest()]
+        return sha.hexdigest()
+
+    def fingerprint(self, name):
+        stage = self.stages[name]
+        key = {"version": PIPELINE_VERSION, "params": stage.params, "outputs": stage.outputs,
+               "inputs": {path: self.digest(path) for path in stage.inputs}}
+        return hashlib.sha256(json.dumps(key, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def _outputs(self, name):
+        return {path: self.digest(path) for path in self.stages[name].outputs}
+
+    def is_current(self, name, fingerprint):
+        done = self.state["stages"].get(name)
+        return bool(done) and done["fingerprint"] == fingerprint and done["outputs"] == self._outputs(name)
+
+    def run(self, targets=None, jobs=1, force=False, instrumentation=None):
+        """Run the stale stages among ``targets`` (default: all) and their upstream stages.
+
+        Returns ``{"ran": [...], "skipped": [...]}``. With more than one job,
+        stale ``parallel`` stages of the same depth run in worker processes.
+        A failing stage raises; the stages finished before it stay recorded.
+        ``instrumentation.cancel()`` stops the run with ``Cancelled`` at the
+        next stage, sheet or demand.
+        """
+        ran, skipped = [], []
+        results = {}
+        for level in self._levels(targets):
+            stale = {}
+            for name in level:
+                fingerprint = self.fingerprint(name)
+                if not force and self.is_current(name, fingerprint):
+                    skipped.append(name)
+                else:
+                    stale[name] = fingerprint
+            pooled = [name for name in stale if self.stages[name].parallel] if jobs > 1 else []
+            batches = [[name] for name in stale if name not in pooled] + ([pooled] if pooled else [])
+            for batch in batches:
+                progress = None
+                if instrumentation:
+                    instrumentation.check()
+                    progress = partial(instrumentation.progress, "+".join(batch))
+                local = {"instrumentation": instrumentation} if len(batch) == 1 else {}  # run_tasks stays in-process
+                with instrumentation.span("+".join(batch)) if instrumentation else nullcontext():
+                    tasks = [(stage, dict(local, **{use: results.get(use) for use in stage.uses}))
+                             for stage in (self.stages[name] for name in batch)]
+                    results.update(zip(batch, run_tasks(_call, tasks, jobs, progress)))
+                for name in batch:
+                    self.state["stages"][name] = {"fingerprint": stale[name], "outputs": self._outputs(name)}
+                    self._recorded.add(name)
+                    ran.append(name)
+                self.save()
+        return {"ran": ran, "skipped": skipped}
+
+    def save(self):
+        """Merge this run's stages into the state file, keeping what other runs recorded since."""
+        with _STATE_LOCK:
+            state = self._read_state()
+            state["files"].update(self.state["files"])
+            state["stages"].update({name: self.state["stages"][name] for name in self._recorded})
+            tmp_path = f"{self.state_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(tmp_path, self.state_path)
+
+
+def _read_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def run_schedule(schedule_path, json_paths, engine, jobs, spacing_rules, exclusions=None,
+                 students=None, teachers=None, match=None, instrumentation=None):
+    """Schedule and write the entries to ``schedule_path``.
+
+    Imports that ran in this process hand their data over directly; the
+    others are read from their files in ``json_paths``.
+    """
+    students = students if students is not None else _read_json(json_paths["student"])
+    teachers, dates = teachers if teachers is not None else (_read_json(json_paths["teacher"]),
+                                                             _read_json(json_paths["dates"]))
+    match = match if match is not None else _read_json(json_paths["match"])
+    sr = Schedule_result(students, teachers, match, [], None, dates, engine=engine, jobs=jobs,
+                         spacing_rules=spacing_rules, exclusions=exclusions, instrumentation=instrumentation)
+    sr.normalize_student_names()
+    sr.generate_schedule()
+    tmp_path = f"{schedule_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"date_list": sr.date_list, "entries": sr.schedule_data}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, schedule_path)
+
+
+def write_workbook(schedule_path, student_templates, teacher_template, output_path, category, streaming,
+                   instrumentation=None):
+    """Write the teacher workbook (``category`` None) or one grade's student workbook."""
+    scheduled = _read_json(schedule_path)
+    sr = Schedule_result({}, {}, [], student_templates, teacher_template, scheduled["date_list"], streaming=streaming,
+                         instrumentation=instrumentation)
+    sr.schedule_data = scheduled["entries"]
+    if category is None:
+        sr.teacher_output_path = output_path
+        sr.generate_teacher_excel()
+    else:
+        sr.student_output_dirs = {category: output_path}
+        sr.generate_student_excels([category])
+
+
+def build_pipeline(student_paths=None, teacher_paths=None, match_path=None, student_templates=(),
+                   teacher_template=None, output_dir="output", engine="greedy", import_jobs=1, schedule_jobs=1,
+                   streaming=False, cache=None, spacing_rules=DEFAULT_SPACING_RULES, exclusions_path=EXCLUSIONS_PATH,
+                   work_dir="."):
+    """The scheduling DAG: three imports, scheduling, the teacher and the per-grade student workbooks.
+
+    The imports' JSON files, ``schedule_data.json`` and the pipeline state
+    live in ``work_dir``, so runs with different work directories do not
+    touch each other's files. An import whose workbooks are not given is
+    left out, and its JSON file is used as a source instead. The
+    exclusion windows at ``exclusions_path`` are an input of the imports
+    and of scheduling.
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    json_paths = {key: os.path.join(work_dir, name) for key, name in JSON_FILES.items()}
+    schedule_path = os.path.join(work_dir, SCHEDULE_PATH)
+    pipeline = Pipeline(os.path.join(work_dir, STATE_PATH))
+    exclusions = Exclusions.load(exclusions_path)
+    if student_paths:
+        pipeline.add("students", load_students,
+                     (list(student_paths), import_jobs, cache, json_paths["student"], exclusions),
+                     inputs=[*student_paths, exclusions_path], outputs=[json_paths["student"]],
+                     params={"parser": student_data.PARSER_VERSION})
+    if teacher_paths:
+        teacher_paths = [teacher_paths] if isinstance(teacher_paths, str) else list(teacher_paths)
+        pipeline.add("teachers", load_teachers,
+                     (teacher_paths, import_jobs, cache, json_paths["teacher"], json_paths["dates"], exclusions),
+                     inputs=[*teacher_paths, exclusions_path], outputs=[json_paths["teacher"], json_paths["dates"]],
+                     params={"parser": teacher_schedule.PARSER_VERSION})
+    if match_path:
+        pipeline.add("match", load_match, (match_path, cache, json_paths["match"]), inputs=[match_path],
+                     outputs=[json_paths["match"]], params={"parser": match_module.PARSER_VERSION})
+
+    pipeline.add("schedule", run_schedule,
+                 (schedule_path, json_paths, engine, schedule_jobs, tuple(spacing_rules), exclusions),
+                 inputs=[*json_paths.values(), exclusions_path], outputs=[schedule_path],
+                 uses=("students", "teachers", "match"),
+                 params={"engine": engine, "spacing_rules": [repr(rule) for rule in spacing_rules]})
+
+    student_templates = [student_templates] if isinstance(student_templates, str) else list(student_templates)
+    workbooks = [("teacher_excel", None, os.path.join(output_dir, "teachers_schedule.xlsx"), [teacher_template])]
+    workbooks += [(f"students_{category}_excel", category, os.path.join(output_dir, f"students_{category}.xlsx"),
+                   student_templates) for category in CATEGORIES]
+    for name, category, output_path, templates in workbooks:
+        pipeline.add(name, write_workbook,
+                     (schedule_path, student_templates, teacher_template, output_path, category, streaming),
+                     inputs=[schedule_path, *templates], outputs=[output_path],
+                     params={"streaming": streaming}, parallel=True)
+    return pipeline
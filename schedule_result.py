@@ -1,22 +1,27 @@
 import json
 import os
-from openpyxl import load_workbook, Workbook
 import unicodedata
 import re
-from copy import copy
-from openpyxl.cell.cell import Cell
-from datetime import datetime, timedelta
+from bisect import bisect_left
 from openpyxl import Workbook as OpenpyxlWorkbook
-from openpyxl.utils import get_column_letter
 from collections import defaultdict
 import unicodedata
+import numpy as np
+from availability_index import Availability_index
+from calendar_layout import Calendar_layout
+from spacing_calendar import DEFAULT_SPACING_RULES, Spacing_calendar
+from flow_engine import plan_assignments
+from partition import find_components, pack_components
+from parallel_import import run_tasks
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from instrumentation import Instrumentation
+from template_engine import Output_book, compile_template, merged_anchors, template_cache
+from name_registry import Name_registry, normalize_name as _normalize_name
 
-def _normalize_name(name):
-    # Convert full-width to half-width, strip, remove extra spaces
-    name = unicodedata.normalize("NFKC", name)
-    name = name.replace("　", " ")  # full-width space to half-width
-    name = " ".join(name.strip().split())  # remove double spaces
-    return name
+SLOT_CAPACITY = 2  # students per (teacher, date, time)
+
+ENGINES = ("greedy", "flow")
 
 TIME_ROW_MAP = {
     "13:10":5 ,
@@ -27,38 +32,39 @@ TIME_ROW_MAP = {
 }
 
 def copy_worksheet_template(target_wb, template_ws, new_title):
-    new_ws = target_wb.create_sheet(title=new_title)
-    merged_ranges = set()
-    for merged_range in template_ws.merged_cells.ranges:
-        merged_ranges.update(merged_range.cells)
-    for row in template_ws.iter_rows():
-        for cell in row:
-            if not isinstance(cell, Cell):
-                continue
-            is_merged = (cell.coordinate in merged_ranges)
-            new_cell = new_ws.cell(row=cell.row, column=cell.column)
-            if not is_merged:
-                new_cell.value = cell.value
-            if cell.has_style:
-                new_cell.font = copy(cell.font)
-                new_cell.border = copy(cell.border)
-                new_cell.fill = copy(cell.fill)
-                new_cell.number_format = copy(cell.number_format)
-                new_cell.protection = copy(cell.protection)
-                new_cell.alignment = copy(cell.alignment)
-    for merged_range in template_ws.merged_cells.ranges:
-        new_ws.merge_cells(str(merged_range))
-    return new_ws
+    return compile_template(template_ws).stamp(target_wb, new_title)
 
 def get_top_left_if_merged(ws, row, col):
-    cell_coord = f"{get_column_letter(col)}{row}"
-    for merged_range in ws.merged_cells.ranges:
-        if cell_coord in merged_range:
-            return ws.cell(row=merged_range.min_row, column=merged_range.min_col)
+    row, col = merged_anchors(ws).get((row, col), (row, col))
     return ws.cell(row=row, column=col)
 
+def _schedule_component(task):
+    """Worker entry point: schedule one group of independent demands."""
+    student_data, teacher_data, demands, date_list, spacing_rules, engine, instrumented, exclusions = task
+    sr = Schedule_result(student_data, teacher_data, [], [], None, date_list,
+                         spacing_rules=spacing_rules, engine=engine, exclusions=exclusions,
+                         instrumentation=Instrumentation() if instrumented else None)
+    sr._schedule_demands(demands)
+    return sr.schedule_data, sr.entry_booths, sr.instrumentation.counters() if instrumented else None
+
+def _generate_output(task):
+    """Worker entry point: write one output workbook (``category`` None is the teacher workbook)."""
+    schedule_data, date_list, student_template, teacher_template, streaming, output_paths, category = task
+    sr = Schedule_result({}, {}, [], student_template, teacher_template, date_list, streaming=streaming)
+    sr.schedule_data = schedule_data
+    sr.teacher_output_path, sr.student_output_dirs = output_paths
+    if category is None:
+        sr.generate_teacher_excel()
+    else:
+        sr.generate_student_excels([category])
+    return sr.ambiguous_names
+
 class Schedule_result:
-    def __init__(self, student_data, teacher_data, match_data, student_template, teacher_template, date_list):
+    def __init__(self, student_data, teacher_data, match_data, student_template, teacher_template, date_list,
+                 spacing_rules=DEFAULT_SPACING_RULES, engine="greedy", jobs=1, templates=None, streaming=False,
+                 instrumentation=None, exclusions=None):
+        if engine not in ENGINES:
+            raise ValueError(f"engine must be one of {ENGINES}, got {engine!r}")
         # Ensure that all names in student_data are normalized properly.
         self.student_data = {
             _normalize_name(k): v for k, v in student_data.items()
@@ -76,30 +82,70 @@ class Schedule_result:
             'middle': "output/students_middle.xlsx",
             'high': "output/students_high.xlsx",
         }
-        self.schedule_data = []
+        self._reset_entries()  # schedule_data, entry_booths and their per-person index
         self.date_order = []
         self.used_teacher_slots = {}  # (teacher, date, time, booth_index) -> True
+        self.index = None  # Availability_index, compiled by generate_schedule
+        self._demands = None  # (student, demand) pairs of the last run, in priority order; see _index_demands
+        self.spacing_rules = tuple(spacing_rules)
+        self.engine = engine
+        self.jobs = max(1, int(jobs))
+        self.templates = templates or template_cache  # Template_cache for template paths
+        self.streaming = streaming  # write-only workbooks, each sheet serialized when complete
+        self.ambiguous_names = []  # (name, chosen sheet, candidate sheets) from the last output run
+        self.instrumentation = instrumentation  # optional Instrumentation: spans, rejection counters, progress
+        self.exclusions = exclusions  # optional Exclusions: closed slots masked out of the index
 
     def run(self):
         # Normalize student names before running the schedule
-        self.normalize_student_names()
-        self.generate_schedule()
-        self.generate_teacher_excel()
-        self.generate_student_excels()
+        with self._span("normalize"):
+            self.normalize_student_names()
+        with self._span("generate_schedule"):
+            self.generate_schedule()
+        with self._span("generate_outputs"):
+            self.generate_outputs()
+
+    def _span(self, name):
+        return self.instrumentation.span(name) if self.instrumentation else nullcontext()
+
+    def _progress(self, stage, done, total):
+        if self.instrumentation:
+            self.instrumentation.progress(stage, done, total)
+
+    def generate_outputs(self, jobs=None):
+        """Write the teacher workbook and the per-grade student workbooks.
+
+        The files share nothing once ``schedule_data`` exists, so with more
+        than one job (default ``self.jobs``) each is written by its own
+        worker process; the first failure stops the rest.
+        """
+        jobs = self.jobs if jobs is None else max(1, int(jobs))
+        categories = [category for category, entries in self._group_students().items() if entries]
+        if jobs <= 1:
+            with self._span("write_teacher"):
+                self.generate_teacher_excel()
+            self.generate_student_excels(categories)
+            return
+        output_paths = (self.teacher_output_path, self.student_output_dirs)
+        tasks = [(self.schedule_data, self.date_list, self.student_template, self.teacher_template,
+                  self.streaming, output_paths, category) for category in [None, *categories]]
+        for ambiguous in run_tasks(_generate_output, tasks, jobs):
+            self.ambiguous_names.extend(item for item in ambiguous if item not in self.ambiguous_names)
+
+    def build_index(self):
+        self.index = Availability_index(self.student_data, self.teacher_data, self.date_list, TIME_ROW_MAP,
+                                        exclusions=self.exclusions)
+        return self.index
 
     def is_slot_available(self, student, teacher, date, time, booth_index):
-        student = _normalize_name(student)
-        teacher = _normalize_name(teacher)
-        normalized_time = unicodedata.normalize("NFKC", time)
-        available_times_student = list(self.student_data.get(student, {}).get("schedule", {}).get(date, {}).keys())
-        available_times_teacher = list(self.teacher_data.get(teacher, {}).get("schedule", {}).get(date, {}).keys())
-        student_avail = self.student_data.get(student, {}).get("schedule", {}).get(date, {}).get(time, False)
-        teacher_avail = self.teacher_data.get(teacher, {}).get("schedule", {}).get(date, {}).get(time, False)
-        # Fix: Ensure teacher availability at the booth
-        if booth_index >= len(teacher_avail):
+        index = self.index or self.build_index()
+        s = index.student_ids.get(_normalize_name(student))
+        k = index.teacher_ids.get(_normalize_name(teacher))
+        d = index.date_ids.get(date)
+        t = index.time_ids.get(unicodedata.normalize("NFKC", time))
+        if None in (s, k, d, t):
             return False
-            
-        return student_avail and teacher_avail[booth_index]
+        return index.is_available(s, k, d, t, booth_index)
 
     def normalize_student_names(self):
         # Step 1: Normalize keys in student_data
@@ -112,7 +158,8 @@ class Schedule_result:
         for entry in self.subject_data:
             entry['student_name'] = _normalize_name(entry['student_name'])
 
-    def generate_schedule(self):
+    def _collect_demands(self):
+        """Return (student, demand) pairs in greedy priority order."""
         # 1. Group all subject-teacher pairs by student
         student_subject_map = defaultdict(list)
         for entry in self.subject_data:
@@ -143,132 +190,397 @@ class Schedule_result:
             teacher_to_subjects.items(),
             key=lambda x: -sum(sub['count'] for _, sub in x[1])
         )
-        schedule_map = []  # final list of dicts like self.schedule_data
-        teacher_slot_tracker = {}  # (teacher, date, time) -> list of students
-
-        def assign(student, teacher, date, time, booth_index, subject, subject_type, grade):
-            self.student_data[student]['schedule'][date][time] = False
-            self.teacher_data[teacher]['schedule'][date][time][booth_index] = False
-            key = (teacher, date, time, booth_index)
-            self.used_teacher_slots[key] = True
-            teacher_slot_tracker.setdefault((teacher, date, time), []).append(student)
-            schedule_map.append({
-                'date': date,
-                'time': time,
-                'student': student,
-                'teacher': teacher,
-                'subject': subject,
-                'type': subject_type,
-                'grade': grade
-            })
+        demands = []
         for teacher, student_subjects in teacher_priority:
-            teacher = _normalize_name(teacher)
             student_subjects.sort(key=lambda x: x[1]['count'])
-            for student, subject_data in student_subjects:
-                student = _normalize_name(student)
-                remaining = subject_data['count']
-                subject = subject_data['subject']
-                subject_type = subject_data['type']
-                grade = subject_data['grade']
-                last_scheduled_dates = []
-                if student not in self.student_data:
+            demands.extend(student_subjects)
+        return demands
+
+    def generate_schedule(self):
+        demands = [(_normalize_name(student), demand) for student, demand in self._collect_demands()]
+        self._index_demands(demands)
+        components = find_components(demands) if self.jobs > 1 else []
+        if len(components) > 1:
+            self._schedule_parallel(demands, components)
+        else:
+            self._schedule_demands(demands)
+        self.date_order = sorted({entry['date'] for entry in self.schedule_data})
+
+    def _schedule_demands(self, demands):
+        self._reset_entries()
+        index = self.build_index()
+        stats = self.instrumentation
+        resolved = []
+        for student, demand in demands:
+            s = index.student_ids.get(student)
+            k = index.teacher_ids.get(demand['teacher'])
+            if s is not None and k is not None:
+                resolved.append((s, k, demand))
+            elif stats:
+                stats.unresolved += 1
+                stats.unplaced(demand['teacher'], student, demand['count'])
+
+        if self.engine == "flow":
+            remaining = self._place_flow(index, resolved)
+        else:
+            remaining = [(s, k, demand, self._spacing_calendar(index, demand['count']), demand['count'])
+                         for s, k, demand in resolved]
+        for i, (s, k, demand, calendar, left) in enumerate(remaining):
+            left = self._place_greedy(index, s, k, demand, calendar, left)
+            if stats:
+                stats.unplaced(index.teacher_names[k], index.student_names[s], left)
+            self._progress("schedule", i + 1, len(remaining))
+
+    def _schedule_parallel(self, demands, components):
+        """Schedule independent components in worker processes and merge in demand order."""
+        groups = pack_components(components, self.jobs * 4)
+        tasks = []
+        for positions in groups:
+            part = [demands[p] for p in positions]
+            students = {student for student, _ in part}
+            teachers = {demand['teacher'] for _, demand in part}
+            tasks.append((
+                {name: info for name, info in self.student_data.items() if name in students},
+                {name: info for name, info in self.teacher_data.items() if name in teachers},
+                part, self.date_list, self.spacing_rules, self.engine,
+                self.instrumentation is not None, self.exclusions,
+            ))
+        results = []
+        with ProcessPoolExecutor(max_workers=min(self.jobs, len(tasks))) as pool:
+            for result in pool.map(_schedule_component, tasks):
+                results.append(result)
+                self._progress("schedule", len(results), len(tasks))
+
+        rank = {}
+        for pos, (student, demand) in enumerate(demands):
+            rank.setdefault((student, demand['teacher'], demand['subject'], demand['type']), pos)
+        for _, _, counters in results:
+            if counters is not None:
+                self.instrumentation.merge(counters)
+        merged = sorted(
+            (pair for entries, booths, _ in results for pair in zip(entries, booths)),
+            key=lambda pair: rank[(pair[0]['student'], pair[0]['teacher'], pair[0]['subject'], pair[0]['type'])],
+        )
+        self._reset_entries()
+
+        # replay the merged assignments so the parent index reflects them
+        index = self.build_index()
+        for entry, booth_index in merged:
+            self._add_entry(entry, booth_index)
+            index.assign(index.student_ids[entry['student']], index.teacher_ids[entry['teacher']],
+                         index.date_ids[entry['date']], index.time_ids[entry['time']], booth_index)
+            self.used_teacher_slots[(entry['teacher'], entry['date'], entry['time'], booth_index)] = True
+
+    def reschedule(self, previous_schedule, changed_students=None, changed_teachers=None):
+        """Repair ``previous_schedule`` after some availabilities changed.
+
+        ``changed_students`` / ``changed_teachers`` map names to their new
+        records, shaped like the entries of student_schedules.json and
+        teacher_diagonal_schedule.json. Previous entries stay pinned; only
+        entries of changed people that are no longer feasible are released,
+        and only the demands of changed people are re-placed (greedily).
+
+        On the instance that produced ``previous_schedule`` the live index is
+        patched and ``schedule_data`` is edited in place. The changed people's
+        entries and demands are found through the per-person indexes kept
+        by ``_assign``, so the work scales with those entries, not with the
+        schedule. Otherwise the index is compiled once and every entry is
+        re-pinned. Returns the released entries.
+        """
+        changed_students = {_normalize_name(k): v for k, v in (changed_students or {}).items()}
+        changed_teachers = {_normalize_name(k): v for k, v in (changed_teachers or {}).items()}
+        self.student_data.update(changed_students)
+        self.teacher_data.update(changed_teachers)
+
+        index = self.index
+        live = (
+            index is not None
+            and previous_schedule is self.schedule_data
+            and previous_schedule is self._indexed_entries
+            and all(name in index.student_ids for name in changed_students)
+            and all(name in index.teacher_ids for name in changed_teachers)
+        )
+        if live:
+            entries, booths = self.schedule_data, self.entry_booths
+            serials = {n for name in changed_students for n in self._entries_by_student.get(name, ())}
+            serials.update(n for name in changed_teachers for n in self._entries_by_teacher.get(name, ()))
+            affected = [bisect_left(self._entry_serials, n) for n in sorted(serials)]
+            for i in affected:
+                entry = entries[i]
+                index.release(index.student_ids[entry['student']], index.teacher_ids[entry['teacher']],
+                              index.date_ids[entry['date']], index.time_ids[entry['time']], booths[i])
+                self.used_teacher_slots.pop((entry['teacher'], entry['date'], entry['time'], booths[i]), None)
+            for name, info in changed_students.items():
+                index.load_student(index.student_ids[name], info)
+            for name, info in changed_teachers.items():
+                index.load_teacher(index.teacher_ids[name], info)
+        else:
+            index = self.build_index()
+            entries = list(previous_schedule)
+            booths = [None] * len(entries)
+            affected = range(len(entries))
+            self.used_teacher_slots = {}
+
+        # re-pin the affected entries, keeping their booth where it is still open
+        dropped = []
+        released = []
+        kept_dates = defaultdict(list)
+        for i in affected:
+            entry = entries[i]
+            s = index.student_ids.get(entry['student'])
+            k = index.teacher_ids.get(entry['teacher'])
+            d = index.date_ids.get(entry['date'])
+            t = index.time_ids.get(entry['time'])
+            booth_index = -1
+            if None not in (s, k, d, t):
+                booth_index = booths[i]
+                if booth_index is None or not (index.is_available(s, k, d, t, booth_index)
+                                               and index.teacher_load[k, d, t] < SLOT_CAPACITY):
+                    booth_index = index.first_open_booth(s, k, d, t, SLOT_CAPACITY)
+            if booth_index < 0:
+                dropped.append(i)
+                released.append(entry)
+                continue
+            index.assign(s, k, d, t, booth_index)
+            booths[i] = booth_index
+            self.used_teacher_slots[(entry['teacher'], entry['date'], entry['time'], booth_index)] = True
+            kept_dates[(entry['student'], entry['teacher'], entry['subject'], entry['type'])].append(d)
+        if live:
+            for i in reversed(dropped):
+                self._drop_entry(i)
+        else:
+            self._reset_entries()
+            dropped = set(dropped)
+            for i, (entry, booth_index) in enumerate(zip(entries, booths)):
+                if i not in dropped:
+                    self._add_entry(entry, booth_index)
+
+        # re-place the demands of changed people and of released entries, in priority order
+        if self._demands is None:
+            self._index_demands([(_normalize_name(student), demand) for student, demand in self._collect_demands()])
+        positions = {p for name in changed_students for p in self._demands_by_student.get(name, ())}
+        positions.update(p for name in changed_teachers for p in self._demands_by_teacher.get(name, ()))
+        positions.update(p for e in released
+                         for p in self._demands_by_key.get((e['student'], e['teacher'], e['subject'], e['type']), ()))
+        for p in sorted(positions):
+            student, demand = self._demands[p]
+            key = (student, demand['teacher'], demand['subject'], demand['type'])
+            s = index.student_ids.get(student)
+            k = index.teacher_ids.get(demand['teacher'])
+            if s is None or k is None:
+                continue
+            calendar = self._spacing_calendar(index, demand['count'])
+            for d in kept_dates[key]:
+                calendar.mark(d)
+            left = demand['count'] - len(kept_dates[key])
+            if left > 0:
+                self._place_greedy(index, s, k, demand, calendar, left)
+        self.date_order = sorted(date for date, count in self._entries_per_date.items() if count)
+        return released
+
+    def _reset_entries(self):
+        """Empty ``schedule_data`` and the per-person index kept alongside it."""
+        self.schedule_data = []
+        self.entry_booths = []  # booth index of each schedule_data entry
+        self._indexed_entries = self.schedule_data  # the list the index below describes
+        self._entry_serials = []  # ascending id of each entry; positions are found by bisection
+        self._next_serial = 0
+        self._entries_by_student = defaultdict(list)  # name -> serials of its entries
+        self._entries_by_teacher = defaultdict(list)
+        self._entries_per_date = defaultdict(int)
+
+    def _add_entry(self, entry, booth_index):
+        serial = self._next_serial
+        self._next_serial += 1
+        self.schedule_data.append(entry)
+        self.entry_booths.append(booth_index)
+        self._entry_serials.append(serial)
+        self._entries_by_student[entry['student']].append(serial)
+        self._entries_by_teacher[entry['teacher']].append(serial)
+        self._entries_per_date[entry['date']] += 1
+
+    def _drop_entry(self, i):
+        entry, serial = self.schedule_data[i], self._entry_serials[i]
+        self._entries_by_student[entry['student']].remove(serial)
+        self._entries_by_teacher[entry['teacher']].remove(serial)
+        self._entries_per_date[entry['date']] -= 1
+        del self.schedule_data[i], self.entry_booths[i], self._entry_serials[i]
+
+    def _index_demands(self, demands):
+        """Keep ``demands`` (priority order) with their positions per student, teacher and lesson key."""
+        self._demands = demands
+        self._demands_by_student = defaultdict(list)
+        self._demands_by_teacher = defaultdict(list)
+        self._demands_by_key = defaultdict(list)
+        for p, (student, demand) in enumerate(demands):
+            self._demands_by_student[student].append(p)
+            self._demands_by_teacher[demand['teacher']].append(p)
+            self._demands_by_key[(student, demand['teacher'], demand['subject'], demand['type'])].append(p)
+
+    def _spacing_calendar(self, index, count):
+        return Spacing_calendar(index.day_numbers, [r for r in self.spacing_rules if r.applies(count)])
+
+    def _assign(self, index, s, k, d, t, booth_index, demand):
+        index.assign(s, k, d, t, booth_index)
+        if self.instrumentation:
+            self.instrumentation.placed += 1
+        teacher = index.teacher_names[k]
+        date = index.dates[d]
+        time = index.times[t]
+        self.used_teacher_slots[(teacher, date, time, booth_index)] = True
+        self._add_entry({
+            'date': date,
+            'time': time,
+            'student': index.student_names[s],
+            'teacher': teacher,
+            'subject': demand['subject'],
+            'type': demand['type'],
+            'grade': demand['grade']
+        }, booth_index)
+
+    def _place_greedy(self, index, s, k, demand, calendar, remaining):
+        """Take the earliest open slots allowed by ``calendar``; return what is left unplaced."""
+        # (date, time, booth) slots where student, booth and the per-slot cap all allow a lesson
+        if remaining <= 0:
+            return remaining
+        open_slots = index.open_mask(s, k, SLOT_CAPACITY)
+        first_booth = open_slots.argmax(axis=2)
+        stats = self.instrumentation
+        reasons = self._slot_reasons(index, s, k) if stats else None
+        dates, times = open_slots.shape[:2]
+        probed = dates * times  # slots looked at, in (date, time) order
+        for d, t in zip(*np.nonzero(open_slots.any(axis=2))):
+            rule = calendar.blocked_by(d)
+            if rule is not None:
+                if stats:
+                    stats.rejections[rule.name] += 1
+                continue
+            self._assign(index, s, k, d, t, int(first_booth[d, t]), demand)
+            calendar.mark(d)
+            remaining -= 1
+            if remaining <= 0:
+                probed = d * times + t + 1
+                break
+        if stats:
+            stats.probed += int(probed)
+            for reason, mask in reasons.items():
+                stats.rejections[reason] += int(mask[:probed].sum())
+        return remaining
+
+    @staticmethod
+    def _slot_reason(index, s, k, d, t):
+        """Why slot (d, t) is closed to (s, k); the checks of ``_slot_reasons`` for one slot."""
+        if not index.student_free[s, d, t]:
+            return "student_busy"
+        if not index.teacher_free[k, d, t].any():
+            return "booth_taken"
+        return "slot_full"
+
+    @staticmethod
+    def _slot_reasons(index, s, k):
+        """Flat (date, time) masks of why a slot is closed to (s, k), first failing check only."""
+        student_busy = ~index.student_free[s]
+        booth_taken = ~student_busy & ~index.teacher_free[k].any(axis=2)
+        slot_full = ~student_busy & ~booth_taken & (index.teacher_load[k] >= SLOT_CAPACITY)
+        return {"student_busy": student_busy.ravel(), "booth_taken": booth_taken.ravel(),
+                "slot_full": slot_full.ravel()}
+
+    def _place_flow(self, index, resolved):
+        """Place lessons chosen by the min-cost flow plan.
+
+        Proposals that clash with another demand of the same student or break
+        a spacing rule are dropped; the demand is then handed back with its
+        calendar so the greedy pass can top it up.
+        """
+        calendars = [self._spacing_calendar(index, demand['count']) for _, _, demand in resolved]
+        plan = plan_assignments(
+            index,
+            [(s, k, demand['count'], max([r.min_gap_days for r in calendar.rules], default=1))
+             for (s, k, demand), calendar in zip(resolved, calendars)],
+            SLOT_CAPACITY,
+        )
+        stats = self.instrumentation
+        remaining = []
+        for (s, k, demand), calendar, slots in zip(resolved, calendars, plan):
+            left = demand['count']
+            for d, t in slots:
+                if left <= 0:
+                    break
+                booth_index = index.first_open_booth(s, k, d, t, SLOT_CAPACITY)
+                rule = calendar.blocked_by(d) if booth_index >= 0 else None
+                if stats:
+                    stats.probed += 1
+                    if booth_index < 0:
+                        stats.rejections[self._slot_reason(index, s, k, d, t)] += 1
+                    elif rule is not None:
+                        stats.rejections[rule.name] += 1
+                if booth_index < 0 or rule is not None:
                     continue
-                for date in sorted(set(self.date_list) & set(self.student_data[student]['schedule'].keys())):
-                    if remaining <= 0:
-                        break
-                    if date not in self.teacher_data[teacher]['schedule']:
-                        continue
-                    for time in TIME_ROW_MAP:
-                        normalized_time = unicodedata.normalize("NFKC", time)
-                        if normalized_time not in self.teacher_data[teacher]['schedule'][date]:
-                            continue
-                        if remaining <= 0:
-                            break
-                        for booth_index in range(len(self.teacher_data[teacher]['schedule'][date][normalized_time])):
-                            key = (teacher, date, time)
-                            if len(teacher_slot_tracker.get(key, [])) >= 2:
-                                continue
-                            date_obj = datetime.strptime(date, "%Y-%m-%d")
-                            if any(abs((date_obj - prev).days) < 2 for prev in last_scheduled_dates):
-                                continue
-                            if subject_data['count'] > 12 and any(abs((date_obj - prev).days) < 4 for prev in last_scheduled_dates):
-                                continue
-                            if self.is_slot_available(student, teacher, date, normalized_time, booth_index):
-                                assign(student, teacher, date, time, booth_index, subject, subject_type, grade)
-                                last_scheduled_dates.append(date_obj)
-                                remaining -= 1
-                                break
-                # if remaining > 0:
-                #     print(f"⚠️ Could not fully schedule {student} for {subject} with {teacher}, {remaining} left.")
-        self.schedule_data = schedule_map
-        self.date_order = sorted({entry['date'] for entry in schedule_map})
+                self._assign(index, s, k, d, t, booth_index, demand)
+                calendar.mark(d)
+                left -= 1
+            remaining.append((s, k, demand, calendar, left))
+        return remaining
 
     def generate_teacher_excel(self):
             if not self.schedule_data:
                 print("⚠️ No teacher data found — no file saved.")
                 return
-            if isinstance(self.teacher_template, str):
-                self.teacher_template = load_workbook(self.teacher_template)
             template_wb = self.teacher_template
-            template_sheetnames = template_wb.sheetnames
+            if isinstance(template_wb, str):
+                template_wb = self.templates.get(template_wb)
+            registry = Name_registry((sheet_name, sheet_name) for sheet_name in template_wb.sheetnames)
             name_map = {}
 
             def extract_last_name(fullname: str) -> str:
                 return fullname.split()[0] if ' ' in fullname else fullname
 
-            for entry in self.schedule_data:
-                full_name = _normalize_name(entry['teacher'])
-                match = None
-                for sheet_name in template_sheetnames:
-                    normalized_sheet = _normalize_name(sheet_name)
-                    if full_name == normalized_sheet or normalized_sheet in full_name:
-                        match = sheet_name
-                        full_name = _normalize_name(entry['teacher'])
-                        break
+            for teacher in dict.fromkeys(entry['teacher'] for entry in self.schedule_data):
+                full_name = _normalize_name(teacher)
+                match = registry.resolve(full_name)
                 if match:
-                    name_map[full_name] = match
+                    name_map[full_name] = match[1]
                 else:
                     print(f"⚠️ No matching sheet found for teacher: {full_name}")
+            self._report_ambiguous(registry)
 
-            output_wb = Workbook()
-            output_wb.remove(output_wb.active)
-            handled_teachers = set()
-
+            # one sheet per teacher, filled from that teacher's entries in schedule order
+            entries_by_teacher = defaultdict(list)
             for entry in self.schedule_data:
-                teacher = entry['teacher']
-                last_name = extract_last_name(teacher)
-                if teacher not in name_map:
-                    continue
-                template_sheetname = name_map[teacher]
-                if teacher not in handled_teachers:
-                    template_ws = self.teacher_template[template_sheetname]
-                    new_ws = copy_worksheet_template(output_wb, template_ws, last_name[:30])
-                    handled_teachers.add(teacher)
-                else:
-                    new_ws = output_wb[last_name[:30]]
+                if entry['teacher'] in name_map:
+                    entries_by_teacher[entry['teacher']].append(entry)
 
-                row = int(TIME_ROW_MAP.get(entry['time'])) + 8 * self._date_to_row(entry['date'])
-                col = self._date_to_col(entry['date'])
-                if col < 1 or row < 1:
-                    continue
+            book = Output_book(streaming=self.streaming)
+            for i, (teacher, entries) in enumerate(entries_by_teacher.items()):
+                self._progress("write_teacher", i + 1, len(entries_by_teacher))
+                last_name = extract_last_name(teacher)
+                template_ws = template_wb[name_map[teacher]]
+                sheet = book.add_sheet(template_ws, last_name[:30])
+                layout = self._layout(template_ws, base_col=3)
+                for entry in entries:
+                    anchor = layout.anchor(entry['date'], entry['time'])
+                    if anchor is None:
+                        continue
+                    row, col = anchor
 
-                student_last_name = extract_last_name(entry['student'])
-                subj_abbr = (entry['subject'][:1] if entry.get('subject') else "") + (entry['type'][:1] if entry.get('type') else "")
-                entry_text = f"{student_last_name}:{subj_abbr}"
+                    student_last_name = extract_last_name(entry['student'])
+                    subj_abbr = (entry['subject'][:1] if entry.get('subject') else "") + (entry['type'][:1] if entry.get('type') else "")
+                    entry_text = f"{student_last_name}:{subj_abbr}"
 
-                cell_primary = get_top_left_if_merged(new_ws, row, col)
-                cell_secondary = get_top_left_if_merged(new_ws, row, col + 1)
+                    cell_primary = sheet.anchor(row, col)
+                    cell_secondary = sheet.anchor(row, col + 1)
 
-                if not cell_primary.value:
-                    cell_primary.value = entry_text
-                elif not cell_secondary.value:
-                    cell_secondary.value = entry_text
+                    if not sheet.value(*cell_primary):
+                        sheet.set(*cell_primary, entry_text)
+                    elif not sheet.value(*cell_secondary):
+                        sheet.set(*cell_secondary, entry_text)
+                sheet.close()
 
             os.makedirs(os.path.dirname(self.teacher_output_path), exist_ok=True)
-            output_wb.save(self.teacher_output_path)
+            book.save(self.teacher_output_path)
 
         
-    def generate_student_excels(self):
+    def _group_students(self):
         def normalize_grade(raw_grade):
             raw = raw_grade.lower()
             if any(k in raw for k in ['小', 'elementary', '小学']):
@@ -285,70 +597,78 @@ class Schedule_result:
             grade = normalize_grade(grade_raw)
             if grade in grouped_students:
                 grouped_students[grade].append(entry)
+        return grouped_students
+
+    def generate_student_excels(self, categories=None):
+        """Write the student workbook of each grade in ``categories`` (default: all)."""
+        grouped_students = self._group_students()
+        template_wbs = []
+        for student_templ in self.student_template:
+            if isinstance(student_templ, str):
+                template_wbs.append(self.templates.get(student_templ))
+            elif isinstance(student_templ, OpenpyxlWorkbook):
+                template_wbs.append(student_templ)
+            else:
+                raise TypeError("student_templ must be a path or openpyxl Workbook")
+        registry = Name_registry(
+            (template_wb, sheet_name) for template_wb in template_wbs for sheet_name in template_wb.sheetnames
+        )
 
         for category, entries in grouped_students.items():
-            if not entries:
+            if not entries or (categories is not None and category not in categories):
+                continue
+            with self._span(f"write_students_{category}"):
+                self._write_student_book(category, entries, registry)
+        self._report_ambiguous(registry)
+
+    def _write_student_book(self, category, entries, registry):
+        book = Output_book(streaming=self.streaming)
+        entries_by_student = defaultdict(list)
+        for entry in entries:
+            if entry.get('student'):
+                entries_by_student[_normalize_name(entry['student'])].append(entry)
+        for i, student in enumerate(sorted(entries_by_student)):
+            self._progress(f"write_students_{category}", i + 1, len(entries_by_student))
+            match = registry.resolve(student, match_parts=True)
+            if match is None:
+                print(f"⚠️ No matching sheet found for student: {student}")
                 continue
-            wb = Workbook()
-            wb.remove(wb.active)
-            students = sorted({
-                _normalize_name(entry['student']) 
-                for entry in entries 
-                if entry.get('student')
-            })
-            for student in students:
-                student_entries = [e for e in entries if _normalize_name(e['student']) == student]
-                matched = False
-                for student_templ in self.student_template:
-                    if isinstance(student_templ, str):
-                        template_wb = load_workbook(student_templ)
-                    elif isinstance(student_templ, OpenpyxlWorkbook):
-                        template_wb = student_templ
-                    else:
-                        raise TypeError("student_templ must be a path or openpyxl Workbook")
-                    for sheet_name in template_wb.sheetnames:
-                        student_norm = _normalize_name(student)
-                        sheet_norm = _normalize_name(sheet_name)
-                        # Direct full or partial match
-                        if (
-                            student_norm == sheet_norm or
-                            student_norm in sheet_norm or
-                            sheet_norm in student_norm or
-                            any(part in sheet_norm for part in student_norm.split())
-                        ):
-                            template_ws = template_wb[sheet_name]
-                            new_sheet_name = f"{sheet_name[:9]}"
-                            new_ws = copy_worksheet_template(wb, template_ws, new_sheet_name)
-                            for entry in student_entries:
-                                row = int(TIME_ROW_MAP.get(entry['time'])) + 8 * self._date_to_row(entry['date']) 
-                                col = self._date_to_col(entry['date'])
-                                if row and col:
-                                    new_ws.cell(row=row, column=col-1).value = entry['subject']
-                                    new_ws.cell(row=row, column=col).value = entry['type']
-                                else:
-                                    print(f"⚠️ Skipping invalid date/time in entry: {entry}")
-                            matched = True
-                            break  # Stop after first matching sheet
-                if not matched:
-                    print(f"⚠️ No matching sheet found for student: {student}")
-            # Ensure workbook has at least one visible sheet
-            if not wb.sheetnames:
-                fallback_ws = wb.create_sheet("NoMatches")
-                fallback_ws["A1"] = "⚠️ No matching sheets found for any student in this group."
-            output_path = self.student_output_dirs[category]
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            wb.save(output_path)
-            print(f"💾 Saved: {output_path}")
-    def _date_to_col(self, date_str):
-        base_col = 2
-        try:
-            index = self.date_list.index(date_str) %5
-        except ValueError:
-            index = 0
-        return base_col + index * 2 + 1
-    def _date_to_row(self, date_str):
-        try:
-            index = int(self.date_list.index(date_str) /5)
-        except ValueError:
-            index = 0
-        return index
+            template_wb, sheet_name = match
+            template_ws = template_wb[sheet_name]
+            new_sheet_name = f"{sheet_name[:9]}"
+            sheet = book.add_sheet(template_ws, new_sheet_name)
+            layout = self._layout(template_ws, base_col=2)
+            for entry in entries_by_student[student]:
+                anchor = layout.anchor(entry['date'], entry['time'])
+                if anchor and any(sheet.anchor(anchor[0], c) != (anchor[0], c) for c in (anchor[1], anchor[1] + 1)):
+                    print(f"⚠️ Skipping entry on merged template cells: {entry}")
+                elif anchor:
+                    row, col = anchor
+                    sheet.set(row, col, entry['subject'])
+                    sheet.set(row, col + 1, entry['type'])
+                else:
+                    print(f"⚠️ Skipping invalid date/time in entry: {entry}")
+            sheet.close()
+        # Ensure workbook has at least one visible sheet
+        if not book.sheetnames:
+            book.add_message_sheet("NoMatches", "⚠️ No matching sheets found for any student in this group.")
+        output_path = self.student_output_dirs[category]
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        book.save(output_path)
+        print(f"💾 Saved: {output_path}")
+
+    def _layout(self, template_ws, base_col):
+        """Slot layout of one template sheet, read off its labels once and kept with its compiled form.
+
+        A sheet without calendar labels falls back to laying ``date_list``
+        out in the default 5-day blocks.
+        """
+        layout = compile_template(template_ws).layout(base_col)
+        if not layout.slots:
+            layout = Calendar_layout.from_dates(self.date_list, TIME_ROW_MAP, base_col=base_col)
+        return layout
+
+    def _report_ambiguous(self, registry):
+        for name, chosen, candidates in registry.ambiguous:
+            print(f"⚠️ Ambiguous sheet match for {name}: using {chosen} of {candidates}")
+        self.ambiguous_names.extend(registry.ambiguous)
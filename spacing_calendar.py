@@ -0,0 +1,54 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class Spacing_rule:
+    """Lessons of one demand must be at least ``min_gap_days`` apart.
+
+    The rule only applies to demands with more than ``min_count`` lessons.
+    """
+    name: str
+    min_gap_days: int
+    min_count: int = 0
+
+    def applies(self, count: int) -> bool:
+        return count > self.min_count
+
+
+DEFAULT_SPACING_RULES = (
+    Spacing_rule("gap_2_days", min_gap_days=2),
+    Spacing_rule("gap_4_days", min_gap_days=4, min_count=12),
+)
+
+
+class Spacing_calendar:
+    """Blocked-day bitmasks for one demand, one mask per applicable rule.
+
+    ``day_numbers`` holds the date ordinal of every date id and is computed
+    once per index; ``mark`` and ``blocked_by`` are O(1) per rule.
+    """
+
+    def __init__(self, day_numbers, rules):
+        self.rules = list(rules)
+        widest = max((rule.min_gap_days for rule in self.rules), default=1)
+        base = (min(day_numbers) if len(day_numbers) else 0) - widest
+        self.offsets = [int(day) - base for day in day_numbers]
+        self.blocked = [0] * len(self.rules)
+
+    def blocked_by(self, d) -> Optional[Spacing_rule]:
+        offset = self.offsets[d]
+        for rule, mask in zip(self.rules, self.blocked):
+            if mask >> offset & 1:
+                return rule
+        return None
+
+    def is_blocked(self, d) -> bool:
+        return self.blocked_by(d) is not None
+
+    def mark(self, d) -> None:
+        offset = self.offsets[d]
+        for i, rule in enumerate(self.rules):
+            gap = rule.min_gap_days
+            if gap > 0:
+                self.blocked[i] |= ((1 << (2 * gap - 1)) - 1) << (offset - gap + 1)
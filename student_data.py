@@ -1,115 +1,125 @@
-import pandas as pd
 import json
-from datetime import datetime
-import re
-import openpyxl
+from functools import partial
+from itertools import count
+
+from calendar_layout import Calendar_layout
+from exclusions import Exclusions
+from parallel_import import merge_schedules, plan_tasks, run_tasks
+from xlsx_stream import Xlsx_stream, sheet_names
+
+PARSER_VERSION = 3  # bump when the parsed output changes; invalidates cached sheets
+
+
+def _extract_task(task, cache=None):
+    """Worker entry point: parse one workbook or sheet group."""
+    path, sheets = task
+    return Student_data.__new__(Student_data).extract_schedule_calendar_blocks(path, sheets, cache)
+
+
+def load_students(paths, jobs=1, cache=None, json_path=None, exclusions=None, instrumentation=None):
+    """Parse student calendar workbooks into {student: record}, also written to ``json_path`` if given."""
+    return Student_data(paths, jobs=jobs, cache=cache, json_path=json_path, exclusions=exclusions,
+                        instrumentation=instrumentation).data
 
 
 class Student_data:
-    def __init__(self, stu_file_paths) -> None:
+    def __init__(self, stu_file_paths, jobs=1, cache=None, json_path="student_schedules.json",
+                 exclusions=None, instrumentation=None) -> None:
         self.stu_file_paths = stu_file_paths  # List of Excel file paths
+        self.jobs = max(1, int(jobs))  # parser processes
+        self.cache = cache  # optional Parse_cache
+        self.json_path = json_path  # None keeps the records in memory only
+        self.exclusions = exclusions if exclusions is not None else Exclusions.load()  # applied after parsing
+        self.instrumentation = instrumentation  # optional: progress per sheet or task, cancellation
+        self.data = {}  # merged records, as written to student_schedules.json
         self.stu_main()
 
     def _read_path(self, path) -> None:
-        self.xls = pd.ExcelFile(path)
-        self.sheet_names = self.xls.sheet_names
-        self.wb = openpyxl.load_workbook(path)
-        
-    def extract_schedule_calendar_blocks(self, file_path):
+        self.book = Xlsx_stream(path)
+        self.sheet_names = self.book.sheet_names
+
+    def _student_name(self, grid):
+        # Collect values from the next few cells to the right of "生徒名" (G, H, I)
+        for col in range(1, grid.max_column + 1):
+            value = grid.value(1, col)
+            if value and "生徒名" in str(value):
+                next_cells = [grid.value(1, c) for c in range(col + 1, min(col + 3, grid.max_column) + 1)]
+                parts = [str(v).strip().replace("さん", "") for v in next_cells if v]
+                return "".join(parts)
+        return ""
+
+    def iter_calendar_slots(self, grid):
+        """Yield (date, time, free) for every slot of one calendar sheet.
+
+        A slot is free when neither of its two cells has a diagonal border.
+        """
+        layout = Calendar_layout.from_sheet(grid.values, base_col=2)
+        for date_str, time_str, row, col in layout.slots:
+            free = not grid.has_diagonal(row, col) and not grid.has_diagonal(row, col + 1)
+            yield date_str, time_str, free
+
+    def _extract_sheet(self, sheet):
         results = {}
-        self._read_path(file_path)
-
-        for sheet in self.sheet_names:
-            df = self.xls.parse(sheet, header=None)
-            ws = self.wb[sheet]
-            s_sheetname = sheet
-
-            full_name = ""
+        grid = self.book.read_sheet(sheet)
+        full_name = self._student_name(grid)
+
+        for date_str, time_str, free in self.iter_calendar_slots(grid):
+            # ONLY output when both are false (no diagonal)
+            if not free:
+                continue
+            # Initialize student record if not yet added
+            if full_name not in results:
+                results[full_name] = {
+                    "s_sheetname": sheet,
+                    "schedule": {}
+                }
+            # Mark time slot as available
+            results[full_name]["schedule"].setdefault(date_str, {})[time_str] = True
+        return results
 
-            row1 = list(ws.iter_rows(min_row=1, max_row=1, values_only=False))[0]
-            for i, cell in enumerate(row1):
-                if cell.value and "生徒名" in str(cell.value):
-                    # Collect values from the next few cells to the right (G, H, I)
-                    next_cells = row1[i + 1:i + 4]  # get next 3 cells
-                    parts = [str(c.value).strip().replace("さん", "") for c in next_cells if c.value]
-                    full_name = "".join(parts)
-                    break
+    def extract_schedule_calendar_blocks(self, file_path, sheets=None, cache=None, sheet_done=None):
+        results = {}
+        self._read_path(file_path)
 
-            for date_idx in range(2, 49, 8):  # iterate through date rows
-                if date_idx >= len(df):
+        with self.book:
+            for sheet in self.sheet_names:
+                if sheets is not None and sheet not in sheets:
                     continue
-                month_row = df.iloc[date_idx]
-                day_row = df.iloc[date_idx]
-
-                for col in range(1, len(day_row), 2):
-                    month_cell = "" if pd.isna(month_row[0]) else str(month_row[0])
-                    month_match = re.search(r"([0-9０-９]{1,2})月", month_cell)
-                    if not month_match:
-                        continue
-                    month_str = month_match[1].translate(str.maketrans("０１２３４５６７８９", "0123456789"))
-                    current_month = int(month_str)
-
-                    raw_day = "" if pd.isna(day_row[col]) else str(day_row[col])
-                    if "日" not in raw_day:
-                        continue
-                    try:
-                        day = int(re.sub(r"[^\d]", "", raw_day))
-                        class_date = datetime(2025, current_month, day).date()
-                    except ValueError:
-                        continue
-
-                    for row_idx in range(date_idx + 2, date_idx + 7):
-                        if row_idx >= len(df):
-                            continue
-                        time_val = df.iloc[row_idx, 0]
-                        if pd.isna(time_val):
-                            continue
-                        time_match = re.match(r"\d{1,2}:\d{2}", str(time_val))
-                        if not time_match:
-                            continue
-                        time_str = time_match[0]
-
-                        col_letter1 = openpyxl.utils.get_column_letter(col + 1)
-                        col_letter2 = openpyxl.utils.get_column_letter(col + 2)
-                        cell1 = ws[f"{col_letter1}{row_idx + 1}"]
-                        cell2 = ws[f"{col_letter2}{row_idx + 1}"]
-
-                        diag1 = cell1.border and (cell1.border.diagonalUp or cell1.border.diagonalDown)
-                        diag2 = cell2.border and (cell2.border.diagonalUp or cell2.border.diagonalDown)
-
-                        # ONLY output when both are false (no diagonal)
-                        if not diag1 and not diag2:
-                           
-                            date_str = class_date.isoformat()
-                            # Initialize student record if not yet added
-                            if full_name not in results:
-                                results[full_name] = {
-                                    "s_sheetname": s_sheetname,
-                                    "schedule": {}
-                                }
-
-                            # Initialize date if not yet added
-                            if date_str not in results[full_name]["schedule"]:
-                                results[full_name]["schedule"][date_str] = {}
-                            # Mark time slot as available
-                            results[full_name]["schedule"][date_str][time_str] = True
+                key = cache.key("student", PARSER_VERSION, self.book, sheet) if cache else None
+                sheet_results = cache.get(key) if cache else None
+                if sheet_results is None:
+                    sheet_results = self._extract_sheet(sheet)
+                    if cache:
+                        cache.put(key, sheet_results)
+                merge_schedules(results, sheet_results)
+                if sheet_done:
+                    sheet_done()
         return results
+
     def stu_main(self):
         all_data = {}
 
-        for path in self.stu_file_paths:
-            student_data = self.extract_schedule_calendar_blocks(path)
-            for student, info in student_data.items():
-                if student not in all_data:
-                    all_data[student] = info
-                else:
-                    # Merge schedules
-                    for date, slots in info["schedule"].items():
-                        if date not in all_data[student]["schedule"]:
-                            all_data[student]["schedule"][date] = slots
-                        else:
-                            all_data[student]["schedule"][date].update(slots)
-        with open("student_schedules.json", "w", encoding="utf-8") as f:
-            json.dump(all_data, f, ensure_ascii=False, indent=2)
+        if self.cache:
+            self.cache.prune("student", PARSER_VERSION)
+        tasks = plan_tasks(self.stu_file_paths, self.jobs)
+        stats = self.instrumentation
+        if stats and self.jobs <= 1:
+            # parsed in this process: a progress (and cancellation) checkpoint after every sheet
+            total, done = sum(len(sheet_names(path)) for path in self.stu_file_paths), count(1)
+            sheet_done = lambda: stats.progress("import_students", next(done), total)
+            parts = [self.extract_schedule_calendar_blocks(path, sheets, self.cache, sheet_done)
+                     for path, sheets in tasks]
+        else:
+            parts = run_tasks(partial(_extract_task, cache=self.cache), tasks, self.jobs,
+                              partial(stats.progress, "import_students") if stats else None)
+        for student_data in parts:
+            merge_schedules(all_data, student_data)
+        if self.cache:
+            self.cache.evict()
+        all_data = self.exclusions.drop(all_data)
+        self.data = all_data
+        if self.json_path:
+            with open(self.json_path, "w", encoding="utf-8") as f:
+                json.dump(all_data, f, ensure_ascii=False, indent=2)
 
  
@@ -1,133 +1,140 @@
-import openpyxl
-import re
-from datetime import datetime
+from datetime import date
+from functools import partial
+from itertools import count
 import json
 
+import numpy as np
+
+from calendar_layout import Calendar_layout
+from exclusions import Exclusions
+from parallel_import import merge_schedules, plan_tasks, run_tasks
+from xlsx_stream import Xlsx_stream, sheet_names
+
+PARSER_VERSION = 4  # bump when the parsed output changes; invalidates cached sheets
+
+BOOTHS = 2  # booth columns per day
+
+
+def _extract_task(task, cache=None):
+    """Worker entry point: parse one workbook or sheet group."""
+    path, sheets = task
+    parser = Teacher_data.__new__(Teacher_data)
+    parser.date_list = set()
+    return parser.extract_schedule_calendar_blocks(path, sheets, cache), parser.date_list
+
+
+def load_teachers(paths, jobs=1, cache=None, json_path=None, dates_path=None, exclusions=None,
+                  instrumentation=None):
+    """Parse teacher calendar workbooks into ({teacher: record}, sorted ISO lecture dates).
+
+    The records and the dates are also written to ``json_path`` and
+    ``dates_path`` if given.
+    """
+    parser = Teacher_data(paths, jobs=jobs, cache=cache, json_path=json_path, dates_path=dates_path,
+                          exclusions=exclusions, instrumentation=instrumentation)
+    return parser.schedules, sorted(day.isoformat() for day in parser.date_list)
+
+
 class Teacher_data:
-    def __init__(self, stu_file_path) -> None:
-        self.stu_file_path = stu_file_path
+    def __init__(self, stu_file_path, jobs=1, cache=None, json_path="teacher_diagonal_schedule.json",
+                 dates_path="lecture_dates.json", exclusions=None, instrumentation=None) -> None:
+        self.stu_file_path = stu_file_path  # one path or a list of paths
+        self.file_paths = [stu_file_path] if isinstance(stu_file_path, str) else list(stu_file_path)
+        self.jobs = max(1, int(jobs))  # parser processes
+        self.cache = cache  # optional Parse_cache
+        self.json_path = json_path  # None keeps the records in memory only
+        self.dates_path = dates_path
+        self.exclusions = exclusions if exclusions is not None else Exclusions.load()  # applied after parsing
+        self.instrumentation = instrumentation  # optional: progress per sheet or task, cancellation
         self.date_list = set() 
+        self.schedules = {}  # merged records, as written to teacher_diagonal_schedule.json
         self.teach_main()
 
-    def _read_path(self, path) -> None:
-        self.wb = openpyxl.load_workbook(path, data_only=True)
-        self.sheet_names = self.wb.sheetnames
-
-    def _is_excluded(self, date_str, time_str):
-        excluded_times = {
-            "2025-04-05": [("13:10", "17:50")],
-            "2025-04-12": [("13:10", "16:00")]
-        }
-        if date_str in excluded_times:
-            for start, end in excluded_times[date_str]:
-                if start <= time_str <= end:
-                    return True
-        return False
-
-    def _has_diagonal(self, cell):
-        if cell.border is None:
-            return False
-        return cell.border.diagonalUp or cell.border.diagonalDown
-
-    def extract_schedule_calendar_blocks(self, file_path):
+    def extract_schedule_calendar_blocks(self, file_path, sheets=None, cache=None, sheet_done=None):
         results = {}
-        self._read_path(file_path)
-
-        for sheet_name in self.sheet_names:
-            ws = self.wb[sheet_name]
-            full_name = ""
-            row1 = list(ws.iter_rows(min_row=1, max_row=1, values_only=False))[0]
-
-            # Extract teacher's name
-            for i, cell in enumerate(row1):
-                if cell.value and "講師名：" in str(cell.value):
-                    next_cells = row1[i + 1:i + 4]
-                    parts = [str(c.value).strip().replace("さん", "") for c in next_cells if c.value]
-                    full_name = "".join(parts)
-                    if not full_name:
-                        full_name = "Unknown_Teacher"
-                    break
-
-            if not full_name:
-                continue
-
-            # Dynamically find calendar block start rows (e.g., rows with "3月" or "4月")
-            calendar_starts = []
-            for row in range(1, ws.max_row + 1):
-                val = ws.cell(row=row, column=1).value
-                if val and re.search(r"[0-9０-９]{1,2}月", str(val)):
-                    calendar_starts.append(row)
 
-            for row_base in calendar_starts:
-                month_cell = ws.cell(row=row_base, column=1).value
-                if not month_cell:
+        with Xlsx_stream(file_path) as book:
+            self.sheet_names = book.sheet_names
+            for sheet_name in self.sheet_names:
+                if sheets is not None and sheet_name not in sheets:
                     continue
+                key = cache.key("teacher", PARSER_VERSION, book, sheet_name) if cache else None
+                block = cache.get(key) if cache else None
+                if block is None:
+                    sheet_results, dates = self._extract_sheet(book.read_sheet(sheet_name))
+                    block = {"schedule": sheet_results, "dates": sorted(dates)}
+                    if cache:
+                        cache.put(key, block)
+                merge_schedules(results, block["schedule"])
+                self.date_list.update(date.fromisoformat(d) for d in block["dates"])
+                if sheet_done:
+                    sheet_done()
+        return results
 
-                month_match = re.search(r"([0-9０-９]{1,2})月", str(month_cell))
-                if not month_match:
-                    continue
+    def _teacher_name(self, row1):
+        for i, value in enumerate(row1):
+            if value and "講師名：" in str(value):
+                parts = [str(v).strip().replace("さん", "") for v in row1[i + 1:i + 4] if v]
+                return "".join(parts) or "Unknown_Teacher"
+        return ""
 
-                try:
-                    month_str = month_match.group(1).translate(str.maketrans("０１２３４５６７８９", "0123456789"))
-                    current_month = int(month_str)
-                except:
-                    continue
+    def _extract_sheet(self, grid):
+        """Parse one calendar sheet into ({teacher: record}, dates).
 
-                for col in range(3, ws.max_column + 1, 2):
-                    day_cell = ws.cell(row=row_base, column=col).value
-                    if not day_cell or not re.search(r"\d{1,2}", str(day_cell)):
-                        continue
-
-                    try:
-                        day = int(re.sub(r"[^\d]", "", str(day_cell)))
-                        class_date = datetime(2025, current_month, day).date()
-                        self.date_list.add(class_date)
-                        date_str = class_date.isoformat()
-                    except:
-                        continue
-
-                    for r_offset in range(2, 7):
-                        time_cell = ws.cell(row=row_base + r_offset, column=1).value
-                        if not time_cell:
-                            continue
-
-                        time_match = re.match(r"(\d{1,2})[:：](\d{2})", str(time_cell))
-                        if not time_match:
-                            continue
-
-                        time_str = f"{time_match[1].zfill(2)}:{time_match[2]}"
-
-                        if self._is_excluded(date_str, time_str):
-                            continue
-
-                        status = []
-                        for offset in range(2):
-                            check_cell = ws.cell(row=row_base + r_offset, column=col + offset)
-                            is_free = not self._has_diagonal(check_cell)
-                            status.append(is_free)
-                            if not is_free:
-                                # print(f"No diagonal: {check_cell.coordinate} - Value: {check_cell.value}")
-                                continue
-
-                            if full_name not in results:
-                                results[full_name] = { 
-                                    "t_sheetname":sheet_name,
-                                    "schedule": {}
-                                    }
-                            if date_str not in results[full_name]["schedule"]:
-                                results[full_name]["schedule"][date_str] = {}
-                            results[full_name]["schedule"][date_str][time_str] = status
+        Slots are located once through the sheet's ``Calendar_layout``; the
+        diagonal flags of all their booth cells are then taken from a 2-D
+        array in one fancy-indexing step.
+        """
+        results = {}
+        values, diagonal = grid.to_arrays(cols=grid.max_column + BOOTHS - 1)
 
-        return results
-    def teach_main(self):
-        all_schedules = self.extract_schedule_calendar_blocks(self.stu_file_path)
-        output_path = "teacher_diagonal_schedule.json"
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(all_schedules, f, ensure_ascii=False, indent=2)
-        print(f"Schedule exported to {output_path} with {sum(len(v['schedule']) for v in all_schedules.values())} dates total.")
+        full_name = self._teacher_name(list(values[1, 1:grid.max_column + 1]))
+        if not full_name:
+            return results, set()
 
+        layout = Calendar_layout.from_sheet(values, base_col=3)
+        if not layout.slots:
+            return results, set(layout.dates)
+        rows, cols = np.array([(row, col) for _, _, row, col in layout.slots]).T
+        free = ~diagonal[rows[:, None], cols[:, None] + np.arange(BOOTHS)]  # (slot, booth)
+
+        for (date_str, time_str, _, _), booths in zip(layout.slots, free.tolist()):
+            if not any(booths):
+                continue
+            record = results.setdefault(full_name, {"t_sheetname": grid.name, "schedule": {}})
+            record["schedule"].setdefault(date_str, {})[time_str] = booths
+
+        return results, set(layout.dates)
+
+    def teach_main(self):
+        all_schedules = {}
+        if self.cache:
+            self.cache.prune("teacher", PARSER_VERSION)
+        tasks = plan_tasks(self.file_paths, self.jobs)
+        stats = self.instrumentation
+        if stats and self.jobs <= 1:
+            # parsed in this process: a progress (and cancellation) checkpoint after every sheet
+            total, done = sum(len(sheet_names(path)) for path in self.file_paths), count(1)
+            sheet_done = lambda: stats.progress("import_teachers", next(done), total)
+            for path, sheets in tasks:
+                schedules = self.extract_schedule_calendar_blocks(path, sheets, self.cache, sheet_done)
+                merge_schedules(all_schedules, schedules)
+        else:
+            for schedules, dates in run_tasks(partial(_extract_task, cache=self.cache), tasks, self.jobs,
+                                              partial(stats.progress, "import_teachers") if stats else None):
+                merge_schedules(all_schedules, schedules)
+                self.date_list.update(dates)
+        if self.cache:
+            self.cache.evict()
+        all_schedules = self.exclusions.drop(all_schedules, by_teacher=True)
+        self.schedules = all_schedules
+        if self.json_path:
+            with open(self.json_path, "w", encoding="utf-8") as f:
+                json.dump(all_schedules, f, ensure_ascii=False, indent=2)
+            print(f"Schedule exported to {self.json_path} with {sum(len(v['schedule']) for v in all_schedules.values())} dates total.")
 
         # Save date list
-        sorted_dates = sorted(date.isoformat() for date in self.date_list)
-        with open("lecture_dates.json", "w", encoding="utf-8") as f:
-            json.dump(sorted_dates, f, ensure_ascii=False, indent=2)
+        if self.dates_path:
+            sorted_dates = sorted(date.isoformat() for date in self.date_list)
+            with open(self.dates_path, "w", encoding="utf-8") as f:
+                json.dump(sorted_dates, f, ensure_ascii=False, indent=2)
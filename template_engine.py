@@ -0,0 +1,359 @@
+import os
+import weakref
+from collections import OrderedDict
+from copy import copy
+
+import openpyxl
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import Cell, MergedCell
+from openpyxl.worksheet.cell_range import CellRange
+from openpyxl.worksheet.merge import MergedCellRange
+
+from calendar_layout import Calendar_layout
+
+
+# _merged_range does what MergedCellRange.__init__ does in openpyxl 3.1 (ws, the CellRange bounds and start_cell)
+# minus its _get_borders pass. Stamped cells already carry their merged borders, and that pass doubles the cost of
+# stamping a sheet. Re-check it against MergedCellRange.__init__ before allowing another openpyxl version.
+MERGED_RANGE_OPENPYXL = "3.1."
+if not openpyxl.__version__.startswith(MERGED_RANGE_OPENPYXL):
+    raise ImportError(f"template_engine._merged_range was written for openpyxl {MERGED_RANGE_OPENPYXL}x, "
+                      f"found {openpyxl.__version__}; check it against MergedCellRange.__init__")
+
+
+def _merged_range(ws, ref):
+    """MergedCellRange over cells that already carry their merged borders."""
+    merged_range = MergedCellRange.__new__(MergedCellRange)
+    CellRange.__init__(merged_range, range_string=ref)
+    merged_range.ws = ws
+    merged_range.start_cell = ws._cells[(merged_range.min_row, merged_range.min_col)]
+    return merged_range
+
+
+def _anchor_map(ranges):
+    """{(row, col): (anchor row, anchor col)} for every cell covered by ``ranges``."""
+    anchors = {}
+    for merged_range in ranges:
+        anchor = (merged_range.min_row, merged_range.min_col)
+        for cell in merged_range.cells:
+            anchors[cell] = anchor
+    return anchors
+
+
+_anchors = weakref.WeakKeyDictionary()  # worksheet -> anchor map
+
+
+def merged_anchors(ws):
+    """Anchor map of ``ws``, built on first use (sheets stamped from a template get it for free).
+
+    The map is not refreshed when ranges are merged or unmerged later.
+    """
+    anchors = _anchors.get(ws)
+    if anchors is None:
+        anchors = _anchors[ws] = _anchor_map(ws.merged_cells.ranges)
+    return anchors
+
+
+class Compiled_template:
+    """A template worksheet analysed once, then stamped out many times.
+
+    Compiling copies the template into a scratch workbook the slow way once
+    (value and six style objects per cell, then ``merge_cells``, which
+    derives the merged cells' edge borders) and keeps the result as:
+
+    - ``cells``   (row, column, merged, value, data_type, style id) per cell
+    - ``styles``  the distinct cell styles, as detached style objects
+    - ``merged``  the merge range strings
+    - ``anchors`` every merged cell -> its range's top-left cell
+    - ``layout(base_col)`` the calendar layout read off its labels, on first use
+
+    ``stamp`` translates each distinct style into the target workbook once
+    (cached per workbook) and creates the new sheet's cells in bulk, each
+    with a copy of its translated style array.
+    """
+
+    def __init__(self, template_ws):
+        self.title = template_ws.title
+        scratch = self._copy_slowly(template_ws)
+        self.cells = []
+        self.styles = []
+        style_ids = {}
+        for (row, col), cell in scratch._cells.items():
+            style_id = -1
+            if cell.has_style:
+                key = tuple(cell._style)
+                style_id = style_ids.get(key)
+                if style_id is None:
+                    style_id = style_ids[key] = len(self.styles)
+                    self.styles.append((copy(cell.font), copy(cell.border), copy(cell.fill), cell.number_format,
+                                        copy(cell.protection), copy(cell.alignment)))
+            merged = isinstance(cell, MergedCell)
+            self.cells.append((row, col, merged, None if merged else cell._value,
+                               None if merged else cell.data_type, style_id))
+        self.merged = [str(merged_range) for merged_range in template_ws.merged_cells.ranges]
+        self.anchors = _anchor_map(template_ws.merged_cells.ranges)
+        self.rows = {}  # row -> its cells sorted by column, for streaming output
+        for cell in sorted(self.cells):
+            self.rows.setdefault(cell[0], []).append(cell)
+        self.columns = {row: {cell[1] for cell in cells} for row, cells in self.rows.items()}
+        self.merged_cells = {(row, col) for row, col, merged, *_ in self.cells if merged}
+        self.values = {(row, col): value for row, col, merged, value, *_ in self.cells if value is not None}
+        self._translated = weakref.WeakKeyDictionary()  # target workbook -> style arrays
+        self._layouts = {}  # base_col -> Calendar_layout
+
+    @staticmethod
+    def _copy_slowly(template_ws):
+        ws = Workbook().active
+        translated = {}  # template style array -> scratch style array
+        for row in template_ws.iter_rows():
+            for cell in row:
+                if not isinstance(cell, Cell):
+                    continue
+                new_cell = ws.cell(row=cell.row, column=cell.column)
+                new_cell.value = cell.value
+                if cell.has_style:
+                    key = tuple(cell._style)
+                    if key not in translated:
+                        new_cell.font = copy(cell.font)
+                        new_cell.border = copy(cell.border)
+                        new_cell.fill = copy(cell.fill)
+                        new_cell.number_format = copy(cell.number_format)
+                        new_cell.protection = copy(cell.protection)
+                        new_cell.alignment = copy(cell.alignment)
+                        translated[key] = copy(new_cell._style)
+                    else:
+                        new_cell._style = copy(translated[key])
+        for merged_range in template_ws.merged_cells.ranges:
+            ws.merge_cells(str(merged_range))
+        return ws
+
+    def layout(self, base_col):
+        """Calendar_layout of the template's own month, day and time labels."""
+        layout = self._layouts.get(base_col)
+        if layout is None:
+            layout = self._layouts[base_col] = Calendar_layout.from_sheet(self.values, base_col)
+        return layout
+
+    def _styles_for(self, ws):
+        wb = ws.parent
+        arrays = self._translated.get(wb)
+        if arrays is None:
+            arrays = []
+            for font, border, fill, number_format, protection, alignment in self.styles:
+                probe = Cell(ws)
+                probe.font = font
+                probe.border = border
+                probe.fill = fill
+                probe.number_format = number_format
+                probe.protection = protection
+                probe.alignment = alignment
+                arrays.append(probe._style)
+            self._translated[wb] = arrays
+        return arrays
+
+    def stamp(self, target_wb, new_title):
+        new_ws = target_wb.create_sheet(title=new_title)
+        arrays = self._styles_for(new_ws)
+        cells = new_ws._cells
+        for row, col, merged, value, data_type, style_id in self.cells:
+            if merged:
+                cell = MergedCell(new_ws, row=row, column=col)
+                if style_id >= 0:
+                    cell._style = copy(arrays[style_id])
+            else:
+                cell = Cell(new_ws, row=row, column=col,
+                            style_array=copy(arrays[style_id]) if style_id >= 0 else None)
+                cell._value = value
+                cell.data_type = data_type
+            cells[(row, col)] = cell
+        for ref in self.merged:
+            new_ws.merged_cells.add(_merged_range(new_ws, ref))
+        _anchors[new_ws] = self.anchors  # shared, read-only
+        return new_ws
+
+    def write_rows(self, ws, values):
+        """Stream the template into write-only ``ws``, one row at a time.
+
+        ``values`` maps (row, col) to values written over the template.
+        """
+        arrays = self._styles_for(ws)
+        extra = {}  # overlay cells outside the template
+        for row, col in values:
+            if col not in self.columns.get(row, ()):
+                extra.setdefault(row, []).append(col)
+        for row in range(1, max([*self.rows, *extra], default=0) + 1):
+            line = []
+            for _, col, merged, value, data_type, style_id in self.rows.get(row, ()):
+                cell = WriteOnlyCell(ws)
+                if style_id >= 0:
+                    cell._style = copy(arrays[style_id])
+                if (row, col) in values:
+                    cell.value = values[(row, col)]
+                elif not merged:
+                    cell._value = value
+                    cell.data_type = data_type
+                line.extend([None] * (col - len(line) - 1))
+                line.append(cell)
+            for col in sorted(extra.get(row, ())):
+                line.extend([None] * (col - len(line)))
+                line[col - 1] = values[(row, col)]
+            ws.append(line)
+        for ref in self.merged:
+            ws.merged_cells.add(CellRange(ref))
+
+
+class Merged_cell_error(ValueError):
+    """A value was written to a merged cell other than its range's top-left anchor."""
+
+
+class Sheet_draft:
+    """An output sheet stamped from a template, written cell by cell in memory.
+
+    ``set`` raises ``Merged_cell_error`` for a cell covered by a merge range
+    other than the range's anchor; callers write to ``anchor(row, col)`` or
+    skip such cells.
+    """
+
+    def __init__(self, ws):
+        self.ws = ws
+
+    def anchor(self, row, col):
+        return merged_anchors(self.ws).get((row, col), (row, col))
+
+    def value(self, row, col):
+        return self.ws.cell(row=row, column=col).value
+
+    def set(self, row, col, value):
+        if self.anchor(row, col) != (row, col):
+            raise Merged_cell_error(f"cell ({row}, {col}) is merged into {self.anchor(row, col)}")
+        self.ws.cell(row=row, column=col).value = value
+
+    def close(self):
+        pass
+
+
+class Streaming_draft(Sheet_draft):
+    """An output sheet kept as template + overlay and streamed out on ``close``."""
+
+    def __init__(self, ws, template):
+        super().__init__(ws)
+        self.template = template
+        self.values = {}
+
+    def anchor(self, row, col):
+        return self.template.anchors.get((row, col), (row, col))
+
+    def value(self, row, col):
+        if (row, col) in self.values:
+            return self.values[(row, col)]
+        return self.template.values.get((row, col))
+
+    def set(self, row, col, value):
+        if (row, col) in self.template.merged_cells:
+            raise Merged_cell_error(f"cell ({row}, {col}) is merged into {self.anchor(row, col)}")
+        self.values[(row, col)] = value
+
+    def close(self):
+        if self.values is not None:
+            self.template.write_rows(self.ws, self.values)
+            self.values = None
+
+
+class Output_book:
+    """Target workbook of a generator.
+
+    In-memory by default; with ``streaming`` the workbook is write-only and
+    every sheet is serialized as soon as its draft is closed, so memory does
+    not grow with the number of sheets.
+    """
+
+    def __init__(self, streaming=False):
+        self.streaming = streaming
+        self.wb = Workbook(write_only=streaming)
+        if not streaming:
+            self.wb.remove(self.wb.active)
+        self.drafts = []
+
+    @property
+    def sheetnames(self):
+        return self.wb.sheetnames
+
+    def add_sheet(self, template_ws, title):
+        template = compile_template(template_ws)
+        if self.streaming:
+            draft = Streaming_draft(self.wb.create_sheet(title=title), template)
+        else:
+            draft = Sheet_draft(template.stamp(self.wb, title))
+        self.drafts.append(draft)
+        return draft
+
+    def add_message_sheet(self, title, message):
+        ws = self.wb.create_sheet(title)
+        if self.streaming:
+            ws.append([message])
+        else:
+            ws["A1"] = message
+
+    def save(self, path):
+        for draft in self.drafts:
+            draft.close()
+        self.drafts = []
+        self.wb.save(path)
+
+
+_compiled = weakref.WeakKeyDictionary()  # template worksheet -> Compiled_template
+
+
+def compile_template(template_ws):
+    """Compiled form of ``template_ws``, built on first use."""
+    compiled = _compiled.get(template_ws)
+    if compiled is None:
+        compiled = _compiled[template_ws] = Compiled_template(template_ws)
+    return compiled
+
+
+class Template_cache:
+    """Loaded template workbooks, least recently used first out.
+
+    Entries are keyed by absolute path and reloaded when the file's mtime or
+    size changes. The cache is bounded by workbook count and by total cell
+    count (a proxy for memory). The most recently used workbook is always
+    kept. Compiled templates are keyed weakly by worksheet, so they are
+    dropped together with their workbook.
+    """
+
+    def __init__(self, max_workbooks=8, max_cells=2_000_000):
+        self.max_workbooks = max_workbooks
+        self.max_cells = max_cells
+        self.entries = OrderedDict()  # path -> (stamp, workbook, cells)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path):
+        key = os.path.abspath(path)
+        stat = os.stat(key)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == stamp:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[1]
+        self.misses += 1
+        wb = load_workbook(key)
+        self.entries[key] = (stamp, wb, sum(len(ws._cells) for ws in wb.worksheets))
+        self.entries.move_to_end(key)
+        self.evict()
+        return wb
+
+    def evict(self):
+        while len(self.entries) > 1 and (
+                len(self.entries) > self.max_workbooks
+                or sum(cells for _, _, cells in self.entries.values()) > self.max_cells):
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+template_cache = Template_cache()  # shared by the generators for the life of the process
@@ -0,0 +1,269 @@
+import hashlib
+import posixpath
+import re
+import zipfile
+from functools import cached_property
+from xml.etree.ElementTree import iterparse
+
+import numpy as np
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils.cell import coordinate_from_string, column_index_from_string
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_ISO8601, from_excel
+
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+# the whole <sheetData>...</sheetData> element, or a bare <sheetData/>; never stops at a self-closing <c/> inside
+_SHEET_DATA = re.compile(rb"<(?:\w+:)?sheetData\b[^>]*?/>|<(?:\w+:)?sheetData\b[^>]*>.*?</(?:\w+:)?sheetData>", re.S)
+_SHARED_REF = re.compile(rb'<(?:\w+:)?c\b[^>]*?\bt="s"[^>]*>\s*<(?:\w+:)?v>(\d+)<')
+_STYLE_REF = re.compile(rb'<(?:\w+:)?c\b[^>]*?\bs="(\d+)"')
+
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _text(element):
+    """Concatenated <t> text of a string item, skipping phonetic (rPh) runs."""
+    if element is None:
+        return None
+    parts = []
+    for child in element:
+        name = _local(child.tag)
+        if name == "t":
+            parts.append(child.text or "")
+        elif name == "r":
+            parts.extend(t.text or "" for t in child if _local(t.tag) == "t")
+    return "".join(parts)
+
+
+def _is_true(value):
+    return value in ("1", "true")
+
+
+class Sheet_grid:
+    """Values and style ids of one worksheet, keyed by 1-based (row, column)."""
+
+    def __init__(self, book, name):
+        self.book = book
+        self.name = name
+        self.values = {}
+        self.styles = {}
+        self.max_row = 0
+        self.max_column = 0
+
+    def value(self, row, col):
+        return self.values.get((row, col))
+
+    def has_diagonal(self, row, col):
+        diagonal = self.book.diagonal_styles
+        style = self.styles.get((row, col), 0)
+        return style < len(diagonal) and diagonal[style]  # ids beyond cellXfs: no diagonal
+
+    def to_arrays(self, rows=0, cols=0):
+        """Values (object) and diagonal-border flags (bool) as 2-D arrays.
+
+        Indexed by 1-based (row, column) like the grid; row/column 0 and any
+        padding up to ``rows`` x ``cols`` hold None / False.
+        """
+        shape = (max(rows, self.max_row) + 1, max(cols, self.max_column) + 1)
+        values = np.full(shape, None, dtype=object)
+        if self.values:
+            cells = np.array(list(self.values), dtype=np.intp)
+            items = np.empty(len(self.values), dtype=object)
+            items[:] = list(self.values.values())
+            values[cells[:, 0], cells[:, 1]] = items
+        style_ids = np.zeros(shape, dtype=np.intp)
+        if self.styles:
+            cells = np.array(list(self.styles), dtype=np.intp)
+            style_ids[cells[:, 0], cells[:, 1]] = list(self.styles.values())
+        diagonal = np.append(np.asarray(self.book.diagonal_styles, dtype=bool), False)
+        style_ids[style_ids >= len(diagonal) - 1] = len(diagonal) - 1  # ids beyond cellXfs: no diagonal
+        return values, diagonal[style_ids]
+
+
+class Xlsx_stream:
+    """Single-pass reader for .xlsx workbooks.
+
+    The archive is opened once. Shared strings and styles.xml are resolved
+    once, on first use, giving a "has diagonal border" and an "is date" flag per cell style
+    id. Each worksheet's XML is then streamed with iterparse, one sheet at a
+    time, instead of building a full styled object model per file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.archive = zipfile.ZipFile(path)
+        self.epoch = CALENDAR_WINDOWS_1900
+        self.sheets = self._read_workbook()
+        self.sheet_names = [name for name, _ in self.sheets]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.archive.close()
+
+    def _parse(self, part):
+        """Yield every element of a package part on its end tag."""
+        with self.archive.open(part) as f:
+            for _, element in iterparse(f):
+                yield element
+
+    def _read_workbook(self):
+        rels = {}
+        for element in self._parse("xl/_rels/workbook.xml.rels"):
+            if _local(element.tag) == "Relationship":
+                target = element.get("Target")
+                rels[element.get("Id")] = target.lstrip("/") if target.startswith("/") else posixpath.normpath(
+                    posixpath.join("xl", target))
+        sheets = []
+        for element in self._parse("xl/workbook.xml"):
+            name = _local(element.tag)
+            if name == "workbookPr" and _is_true(element.get("date1904")):
+                self.epoch = CALENDAR_MAC_1904
+            elif name == "sheet":
+                sheets.append((element.get("name"), rels[element.get(f"{{{REL_NS}}}id")]))
+        return sheets
+
+    @cached_property
+    def shared_strings(self):
+        return self._read_shared_strings()
+
+    @cached_property
+    def _style_flags(self):
+        return self._read_styles()
+
+    @property
+    def diagonal_styles(self):
+        return self._style_flags[0]
+
+    @property
+    def date_styles(self):
+        return self._style_flags[1]
+
+    @property
+    def timedelta_styles(self):
+        return self._style_flags[2]
+
+    def _read_shared_strings(self):
+        if "xl/sharedStrings.xml" not in self.archive.namelist():
+            return []
+        strings = []
+        for element in self._parse("xl/sharedStrings.xml"):
+            if _local(element.tag) == "si":
+                strings.append(_text(element))
+                element.clear()
+        return strings
+
+    def _read_styles(self):
+        if "xl/styles.xml" not in self.archive.namelist():
+            return [False], [False], [False]
+        formats = dict(BUILTIN_FORMATS)
+        borders, cell_xfs = [], []
+        section = None
+        with self.archive.open("xl/styles.xml") as f:
+            for event, element in iterparse(f, events=("start", "end")):
+                name = _local(element.tag)
+                if event == "start":
+                    if name in ("borders", "cellXfs", "cellStyleXfs"):
+                        section = name
+                    continue
+                if name == "numFmt":
+                    formats[int(element.get("numFmtId"))] = element.get("formatCode")
+                elif name == "border" and section == "borders":
+                    borders.append(_is_true(element.get("diagonalUp")) or _is_true(element.get("diagonalDown")))
+                elif name == "xf" and section == "cellXfs":
+                    cell_xfs.append((int(element.get("borderId", 0)), int(element.get("numFmtId", 0))))
+                elif name in ("borders", "cellXfs", "cellStyleXfs"):
+                    section = None
+        diagonal = [borders[b] if b < len(borders) else False for b, _ in cell_xfs] or [False]
+        codes = [formats.get(f, "General") for _, f in cell_xfs] or ["General"]
+        return diagonal, [is_date_format(c) for c in codes], [is_timedelta_format(c) for c in codes]
+
+    def _cast(self, data_type, raw, style):
+        if data_type == "s":
+            return self.shared_strings[int(raw)]
+        if data_type in ("str", "e"):
+            return raw
+        if data_type == "b":
+            return bool(int(raw))
+        if data_type == "d":
+            return from_ISO8601(raw)
+        value = float(raw) if any(ch in raw for ch in ".Ee") else int(raw)
+        if style < len(self.date_styles) and self.date_styles[style]:
+            return from_excel(value, self.epoch, timedelta=self.timedelta_styles[style])
+        return value
+
+    def iter_cells(self, sheet_name):
+        """Yield (row, column, value, style id) for every cell element of a sheet."""
+        part = dict(self.sheets)[sheet_name]
+        row = col = 0
+        with self.archive.open(part) as f:
+            for event, element in iterparse(f, events=("start", "end")):
+                name = _local(element.tag)
+                if event == "start":
+                    if name == "row":
+                        row = int(element.get("r") or row + 1)
+                        col = 0
+                    continue
+                if name == "c":
+                    ref = element.get("r")
+                    if ref:
+                        letters, row = coordinate_from_string(ref)
+                        col = column_index_from_string(letters)
+                    else:
+                        col += 1
+                    style = int(element.get("s", 0))
+                    data_type = element.get("t", "n")
+                    if data_type == "inlineStr":
+                        value = _text(next((c for c in element if _local(c.tag) == "is"), None))
+                    else:
+                        raw = next((c.text for c in element if _local(c.tag) == "v"), None)
+                        value = None if raw is None else self._cast(data_type, raw, style)
+                    yield row, col, value, style
+                    element.clear()
+                elif name == "row":
+                    element.clear()
+
+    def sheet_fingerprint(self, sheet_name):
+        """Content hash of one sheet, without parsing its XML.
+
+        Covers the sheet name, the raw <sheetData> XML, the shared strings it
+        references and the diagonal/date flags of the styles it uses, so
+        edits to other sheets of the workbook leave it unchanged.
+        """
+        with self.archive.open(dict(self.sheets)[sheet_name]) as f:
+            data = f.read()
+        match = _SHEET_DATA.search(data)
+        if match:
+            data = match.group(0)
+        digest = hashlib.sha256()
+        digest.update(sheet_name.encode("utf-8") + b"\0" + str(self.epoch).encode() + b"\0")
+        digest.update(data)
+        for ref in _SHARED_REF.findall(data):
+            digest.update(b"\0" + self.shared_strings[int(ref)].encode("utf-8"))
+        for style in sorted({int(ref) for ref in _STYLE_REF.findall(data)}):
+            flags = (self.diagonal_styles[style], self.date_styles[style], self.timedelta_styles[style]) \
+                if style < len(self.diagonal_styles) else None
+            digest.update(f"\0{style}:{flags}".encode())
+        return digest.hexdigest()
+
+    def read_sheet(self, sheet_name):
+        grid = Sheet_grid(self, sheet_name)
+        for row, col, value, style in self.iter_cells(sheet_name):
+            if value is not None:
+                grid.values[(row, col)] = value
+            if style:
+                grid.styles[(row, col)] = style
+            grid.max_row = max(grid.max_row, row)
+            grid.max_column = max(grid.max_column, col)
+        return grid
+
+
+def sheet_names(path):
+    """Sheet names of a workbook, read from workbook.xml only."""
+    with Xlsx_stream(path) as book:
+        return book.sheet_names